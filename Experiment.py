@@ -1,23 +1,133 @@
+import functools
 import json
 import sys
 import os
-from SAT_solver import SATSolver
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from SAT_solver import SATSolver, load_rule_base
+from portfolio import PortfolioSolver
+from puzzle_pack import open_pack
+from solver_configs import SOLVER_CONFIGS, SOLVERS
+from sudoku_rules import generate_rules
 import time
 
 
+def list_puzzles(puzzle_set_path):
+    """
+    Lists (puzzle, puzzle name) for a puzzle set: a folder of DIMACS files, or a puzzle pack
+    (see puzzle_pack.py) whose puzzles are referred to as (pack file, index)
+    """
+    if puzzle_set_path.endswith(".pack"):
+        pack = open_pack(puzzle_set_path)
+        return [((puzzle_set_path, index), pack.puzzle_name(index)) for index in range(len(pack))]
+
+    # Get a list of all filenames in the directory, without the directories
+    filenames = sorted(os.listdir(puzzle_set_path))
+    return [(os.path.join(puzzle_set_path, f), f) for f in filenames if os.path.isfile(os.path.join(puzzle_set_path, f))]
+
+
+def load_puzzle(puzzle):
+    """
+    Builds the SATSolver for a puzzle from list_puzzles
+    """
+    if isinstance(puzzle, tuple):
+        pack_file, index = puzzle
+        return open_pack(pack_file).solver(index)
+    return SATSolver(puzzle)
+
+
+def run_puzzle(algo, puzzle, budget=None, separate_solutions=False, max_attempts=3, audit=False, sudoku_frontend=False,
+               preprocess=False):
+    """
+    Solves one puzzle with one solver and returns the recorded measurements.
+    budget holds the keyword arguments for SATSolver.set_budget, a puzzle that runs
+    out of budget is recorded as a timeout instead of holding up the whole run.
+    Solutions are verified in memory, with audit they are also written out and
+    checked again from the files. sudoku_frontend runs the sudoku singles and locked
+    candidates propagation before the solver starts, preprocess the generic CNF preprocessor.
+    With separate_solutions every solver writes into its own solution folder,
+    so jobs for the same puzzle running at the same time don't overwrite each other.
+    """
+    start_time = time.time()
+
+    if algo == "solve_portfolio":
+        # races the default strategies on the puzzle, see portfolio.py
+        portfolio = PortfolioSolver(load_puzzle(puzzle), budget=budget)
+        solver_instance = portfolio.solver
+        solve = portfolio.solve
+    else:
+        solver_instance = load_puzzle(puzzle)
+        solver_instance.set_budget(**(budget or {}))
+        method, kwargs = SOLVER_CONFIGS.get(algo, (algo, {}))
+        solve = functools.partial(getattr(solver_instance, method), **kwargs)
+    if sudoku_frontend:
+        solver_instance.sudoku_preprocess()
+    if preprocess:
+        solver_instance.preprocess()
+    if separate_solutions:
+        solver_instance.solution_folder = f"{solver_instance.solution_folder}/{algo}"
+
+    for attempt in range(max_attempts):
+        result = solve()
+        if solver_instance.status != "SAT":
+            break
+        if audit:
+            solver_instance.write_output()
+            if solver_instance.verify_model() and solver_instance.verify_solution():
+                break
+        elif solver_instance.verify_model():
+            break
+        print("solution bad... trying again")
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+
+    stats = solver_instance.get_stats()
+    data = {"time": elapsed_time, "back_tracks": solver_instance.back_tracks, "status": solver_instance.status,
+            "restarts": stats.get("restarts", 0), "clause_db_bytes": stats.get("clause_db_bytes"),
+            "timings": stats["timings"]}
+    if solver_instance.status == "UNKNOWN":
+        data["timeout"] = True
+    if algo == "solve_portfolio":
+        data["winner"] = portfolio.winner
+        data["clause_db_bytes"] = portfolio.clause_db_bytes
+    return data
+
+
+def run_job(algo, puzzle, budget=None, audit=False, sudoku_frontend=False, preprocess=False):
+    """
+    Worker entry point for the process pool
+    """
+    return run_puzzle(algo, puzzle, budget, separate_solutions=True, audit=audit, sudoku_frontend=sudoku_frontend,
+                      preprocess=preprocess)
+
+
 class SATExperiment():
     """
     Runs 3 heuristics against 2 different sets of problems
     Records how many times each heuristic returns false (i.e. has to backtrack)
     """
-    def __init__(self):
+    def __init__(self, workers=None, timeout=60):
         self.experiment_name = "1000_sudokus"
         self.result_file = f"experiment_data/{self.experiment_name}.json"
-        self.solvers = ["solve_heuristic_2", "solve_heuristic_1", "solve_dpll"]
+        # "solve_portfolio" races the other strategies per puzzle and can be added here as well
+        self.solvers = list(SOLVERS)
         self.puzzle_sets = {
-            "1000" : "test_sets/encoded/9x9_sudokus/1000"
+            "1000" : "test_sets/packed/1000_sudokus.pack"
         }
-        self.skip_puzzles = {"hard_sudoku_13.txt"}
+        # number of worker processes for gather_data_parallel (None uses every core)
+        self.workers = workers
+        # limits for a single (solver, puzzle) job, see SATSolver.set_budget
+        self.budget = {"time_limit": timeout, "max_decisions": None, "max_conflicts": None}
+        # also write every solution and re-check it from disk
+        self.audit = False
+        # run the sudoku constraint propagation front end before every solver
+        self.sudoku_frontend = False
+        # simplify every formula with the CNF preprocessor before solving
+        self.preprocess = False
+        # rules shared by every puzzle set, for gather_data_incremental: generated for
+        # rules_size x rules_size sudokus unless a rules file is set
+        self.rules_file = None
+        self.rules_size = 9
         self.experiment_data = {solver : {} for solver in self.solvers}
         self.load_prev()
 
@@ -31,59 +141,120 @@ class SATExperiment():
             with open(self.result_file, "r") as json_file:
                 saved_data = json.load(json_file)
                 self.experiment_data = saved_data
+                # solvers added since the last run start out without data
+                for solver in self.solvers:
+                    self.experiment_data.setdefault(solver, {})
                 print(f"found old experimental data: {saved_data}")
         else:
             print("old file does not exist... skipping")
 
-    
-    def gather_data(self):
+
+    def pending_jobs(self):
+        """
+        Lists every (solver, puzzle set, puzzle, puzzle name) combination that has no recorded result yet,
+        or only the record of a job that failed
+        """
+        jobs = []
         for algo in self.solvers:
             for puzzle_set, dir_path in self.puzzle_sets.items():
                 # add to dictionary
                 if puzzle_set not in self.experiment_data[algo]:
                     self.experiment_data[algo][puzzle_set] = {}
 
-                # Get a list of all filenames in the directory
-                filenames = os.listdir(dir_path)
+                for puzzle, puzzle_name in list_puzzles(dir_path):
+                    record = self.experiment_data[algo][puzzle_set].get(puzzle_name)
+                    if record is not None and record.get("status") != "ERROR":
+                        continue
+                    jobs.append((algo, puzzle_set, puzzle, puzzle_name))
+        return jobs
 
-                # Filter out directories (optional)
-                file_list = [os.path.join(dir_path, f) for f in filenames if os.path.isfile(os.path.join(dir_path, f))]
+    
+    def gather_data(self):
+        for algo, puzzle_set, puzzle, puzzle_name in self.pending_jobs():
+            print(f"On algorithm: {algo}")
+            print(f"On puzzle set: {puzzle_set}")
+            print(f"On puzzle: {puzzle_name}")
+            print(f"Puzzle: {puzzle}")
 
-                for puzzle in file_list:
-                    puzzle_name = os.path.basename(puzzle)
-                    print(self.skip_puzzles)
+            result = run_puzzle(algo, puzzle, self.budget, audit=self.audit, sudoku_frontend=self.sudoku_frontend,
+                                preprocess=self.preprocess)
+            self.experiment_data[algo][puzzle_set][puzzle_name] = result
+            self.save_progress()
 
-                    if puzzle_name in self.experiment_data[algo][puzzle_set]:
-                        continue
-                    if puzzle_name in self.skip_puzzles:
-                        continue
-                    else:
-                        self.experiment_data[algo][puzzle_set][puzzle_name] = {}
-                    
-                    print(f"On algorithm: {algo}")
-                    print(f"On puzzle set: {puzzle_set}")
-                    print(f"On puzzle: {puzzle_name}")
-                    print(f"Puzzle file path: {puzzle}")
-
-                    start_time = time.time()
-
-                    solver_instance = SATSolver(puzzle)
-                    result = getattr(solver_instance, algo)()
-                    solver_instance.write_output()
-                    while solver_instance.verify_solution() == False:
-                        print("solution bad... trying again")
-                        result = getattr(solver_instance, algo)()
-                        solver_instance.write_output()
-
-                    end_time = time.time()
-                    elapsed_time = end_time - start_time
-                    back_tracks = solver_instance.back_tracks
-
-                    self.experiment_data[algo][puzzle_set][puzzle_name]["time"] = elapsed_time
-                    self.experiment_data[algo][puzzle_set][puzzle_name]["back_tracks"] = back_tracks
-                    self.save_progress()
-
-                    print(f"elapsed time: {elapsed_time}")
+            if result.get("timeout"):
+                print(f"budget exceeded after: {result['time']}")
+            else:
+                print(f"elapsed time: {result['time']}")
+
+    def gather_data_parallel(self):
+        """
+        Same as gather_data, but fans the (solver, puzzle) jobs out over a process pool.
+        Results are saved as they come in, so an interrupted run resumes through load_prev.
+        A job that fails (an exception in the worker, or a worker that died) is recorded with
+        status "ERROR" and run again on the next run, the other jobs carry on.
+        """
+        jobs = self.pending_jobs()
+        print(f"running {len(jobs)} jobs on {self.workers or os.cpu_count()} workers")
+        start_time = time.time()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(run_job, algo, puzzle, self.budget, self.audit, self.sudoku_frontend, self.preprocess): (algo, puzzle_set, puzzle_name)
+                for algo, puzzle_set, puzzle, puzzle_name in jobs
+            }
+            for future in as_completed(futures):
+                algo, puzzle_set, puzzle_name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # counts like a timeout in the statistics: unsolved, after the whole time budget
+                    result = {"time": self.budget.get("time_limit") or time.time() - start_time, "status": "ERROR",
+                              "error": f"{type(e).__name__}: {e}"}
+                self.experiment_data[algo][puzzle_set][puzzle_name] = result
+                self.save_progress()
+
+                if "error" in result:
+                    print(f"{algo} failed on {puzzle_name}: {result['error']}")
+                elif result.get("timeout"):
+                    print(f"{algo} ran out of budget on {puzzle_name}")
+                else:
+                    print(f"{algo} solved {puzzle_name} in {result['time']}")
+
+    def gather_data_incremental(self, heuristic="vsids"):
+        """
+        Solves every puzzle set on one incremental solver built from the rules file,
+        the givens of each puzzle (its unit clauses) are passed as assumptions.
+        Learned clauses carry over between puzzles, results go under "solve_incremental".
+        """
+        algo = "solve_incremental"
+        self.experiment_data.setdefault(algo, {})
+        rule_base = load_rule_base(self.rules_file) if self.rules_file else generate_rules(self.rules_size)
+        solver_instance = SATSolver(self.rules_file or "rules", rule_base=rule_base, givens=[])
+        solver_instance.set_budget(**self.budget)
+
+        for puzzle_set, dir_path in self.puzzle_sets.items():
+            results = self.experiment_data[algo].setdefault(puzzle_set, {})
+            for puzzle, puzzle_name in list_puzzles(dir_path):
+                if puzzle_name in results:
+                    continue
+
+                start_time = time.time()
+                if isinstance(puzzle, tuple):
+                    givens = open_pack(puzzle[0])[puzzle[1]]
+                else:
+                    givens = [clause[0] for clause in SATSolver.parse_dimacs(puzzle) if len(clause) == 1]
+                solver_instance.solve(assumptions=givens, heuristic=heuristic)
+                if solver_instance.status == "SAT" and not solver_instance.verify_model():
+                    print(f"solution bad for {puzzle_name}")
+
+                result = {"time": time.time() - start_time, "back_tracks": solver_instance.back_tracks,
+                          "status": solver_instance.status, "restarts": solver_instance.restarts,
+                          "clause_db_bytes": solver_instance.clause_db_bytes()}
+                if solver_instance.status == "UNKNOWN":
+                    result["timeout"] = True
+                results[puzzle_name] = result
+                self.save_progress()
+                print(f"{algo} finished {puzzle_name} in {result['time']}")
 
     def save_progress(self):
         """
@@ -94,17 +265,45 @@ class SATExperiment():
 
 
     def stat_test(self):
-        pass
+        """
+        Prints median/p95/max time and median back tracks per solver and puzzle set, and how
+        often every solver was the fastest on a puzzle
+        """
+        from benchmark import summarize
+
+        for puzzle_set in self.puzzle_sets:
+            results = {algo: self.experiment_data.get(algo, {}).get(puzzle_set, {}) for algo in self.solvers}
+            for algo, records in results.items():
+                if not records:
+                    continue
+                summary = summarize(records)
+                print(f"{algo:<22} {puzzle_set}: {summary['puzzles']} puzzles, median {summary['median_time']:.4f}s "
+                      f"p95 {summary['p95_time']:.4f}s max {summary['max_time']:.4f}s "
+                      f"back tracks {summary.get('median_back_tracks')} unsolved {summary['unsolved']} "
+                      f"timeouts {summary['timeouts']}")
+
+            wins = {algo: 0 for algo in results}
+            puzzles = set().union(*(records.keys() for records in results.values()))
+            for puzzle in puzzles:
+                times = {algo: records[puzzle]["time"] for algo, records in results.items() if puzzle in records}
+                wins[min(times, key=times.get)] += 1
+            print(f"fastest solver per puzzle in {puzzle_set}: {wins}")
 
     def create_graphs(self):
         pass
 
 def main():
-    experiment = SATExperiment()
-    experiment.gather_data()
+    # python Experiment.py [workers] [timeout]: with a worker count > 0 the jobs run in parallel
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    experiment = SATExperiment(workers=workers, timeout=timeout)
+    if workers:
+        experiment.gather_data_parallel()
+    else:
+        experiment.gather_data()
     experiment.stat_test()
     experiment.create_graphs()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,421 +1,1503 @@
-from copy import deepcopy
+from array import array
+from collections import deque
+from itertools import accumulate
+from operator import sub
+import argparse
+import cProfile
+import functools
+import hashlib
+import mmap
+import pickle
+import pstats
+import re
 import time
+import tracemalloc
 import sys
 import os
+from preprocess import CNFPreprocessor
+from sudoku_frontend import SudokuFrontend, find_exactly_one_groups
+
+DIMACS_HEADER = re.compile(rb"^\s*p\s+cnf\s+(\d+)", re.MULTILINE)
+DIMACS_NON_CLAUSE_LINE = re.compile(rb"^\s*[cp].*$", re.MULTILINE)
+
+
+class VariableHeap():
+    """
+    Binary max-heap of variables ordered by activity. The position of every variable
+    is indexed so a bumped variable can be sifted up in O(log n) instead of re-sorting.
+    """
+    def __init__(self, activity, variables):
+        self.activity = activity
+        self.heap = list(variables)
+        self.indices = [-1] * len(activity)
+        for i, var in enumerate(self.heap):
+            self.indices[var] = i
+        for i in range(len(self.heap) // 2 - 1, -1, -1):
+            self.sift_down(i)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, var):
+        return self.indices[var] >= 0
+
+    def sift_up(self, i):
+        heap = self.heap
+        indices = self.indices
+        activity = self.activity
+        var = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if activity[heap[parent]] >= activity[var]:
+                break
+            heap[i] = heap[parent]
+            indices[heap[i]] = i
+            i = parent
+        heap[i] = var
+        indices[var] = i
+
+    def sift_down(self, i):
+        heap = self.heap
+        indices = self.indices
+        activity = self.activity
+        var = heap[i]
+        size = len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and activity[heap[child + 1]] > activity[heap[child]]:
+                child += 1
+            if activity[heap[child]] <= activity[var]:
+                break
+            heap[i] = heap[child]
+            indices[heap[i]] = i
+            i = child
+        heap[i] = var
+        indices[var] = i
+
+    def insert(self, var):
+        if self.indices[var] >= 0:
+            return
+        self.heap.append(var)
+        self.indices[var] = len(self.heap) - 1
+        self.sift_up(len(self.heap) - 1)
+
+    def increased(self, var):
+        '''
+        Restores the heap order after the activity of var went up
+        '''
+        if self.indices[var] >= 0:
+            self.sift_up(self.indices[var])
+
+    def pop(self):
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        self.indices[top] = -1
+        if heap:
+            heap[0] = last
+            self.indices[last] = 0
+            self.sift_down(0)
+        return top
+
+
+def luby(x):
+    """
+    Element x (counting from 0) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 1 1 2 4 8 ...
+    """
+    size, seq = 1, 0
+    while size < x + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != x:
+        size = (size - 1) >> 1
+        seq -= 1
+        x = x % size
+    return 1 << seq
+
+
+class RestartSchedule():
+    """
+    Decides when the CDCL search restarts. "luby" and "geometric" restart after a growing
+    number of conflicts, "glucose" restarts when the LBD of the recently learned clauses
+    is high compared to the average so far, "none" never restarts.
+    """
+    policies = ("none", "luby", "geometric", "glucose")
+
+    def __init__(self, policy="none", unit=100, factor=1.5, window=50, margin=0.8):
+        if policy not in self.policies:
+            raise Exception(f"Error, unknown restart policy {policy}!")
+        self.policy = policy
+        self.unit = unit
+        self.factor = factor
+        self.margin = margin
+        self.restarts = 0
+        # conflicts since the last restart
+        self.conflicts = 0
+        self.recent_lbd = deque(maxlen=window)
+        self.lbd_total = 0
+        self.lbd_count = 0
+        self.limit = self.next_limit()
+
+    def next_limit(self):
+        if self.policy == "luby":
+            return self.unit * luby(self.restarts)
+        if self.policy == "geometric":
+            return self.unit * self.factor ** self.restarts
+        return None
+
+    def conflict(self, lbd):
+        self.conflicts += 1
+        if self.policy == "glucose":
+            self.recent_lbd.append(lbd)
+            self.lbd_total += lbd
+            self.lbd_count += 1
+
+    def due(self):
+        if self.policy == "glucose":
+            recent = self.recent_lbd
+            return (len(recent) == recent.maxlen
+                    and sum(recent) / len(recent) * self.margin > self.lbd_total / self.lbd_count)
+        return self.limit is not None and self.conflicts >= self.limit
+
+    def restart(self):
+        self.restarts += 1
+        self.conflicts = 0
+        self.recent_lbd.clear()
+        self.limit = self.next_limit()
+
+
+class RuleBase():
+    """
+    Parsed rule clauses (e.g. rules/sudoku-rules-9x9.txt) shared by every puzzle of that size.
+    Solvers built on a rule base copy its flat arrays, the rule base itself is never modified.
+    """
+    def __init__(self, var_names, clause_lits, clause_offsets, file_hash=""):
+        self.var_names = tuple(var_names)
+        self.var_ids = {name: var for var, name in enumerate(self.var_names) if var > 0}
+        self.clause_lits = clause_lits
+        self.clause_offsets = clause_offsets
+        self.file_hash = file_hash
+
+    @classmethod
+    def from_file(cls, rules_file, file_hash=""):
+        solver = SATSolver(rules_file)
+        return cls(solver.var_names, solver.clause_lits, solver.clause_offsets, file_hash)
+
+    def iter_dimacs(self):
+        '''
+        Yields the rule clauses with their original DIMACS literals
+        '''
+        names = self.var_names
+        lits = self.clause_lits
+        offsets = self.clause_offsets
+        for i in range(len(offsets) - 1):
+            yield tuple(names[lit] if lit > 0 else -names[-lit] for lit in lits[offsets[i]:offsets[i + 1]])
+
+    def save(self, cache_file):
+        with open(cache_file, "wb") as f:
+            pickle.dump({
+                "file_hash": self.file_hash,
+                "var_names": array('i', self.var_names),
+                "clause_lits": self.clause_lits,
+                "clause_offsets": self.clause_offsets,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, cache_file):
+        with open(cache_file, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["var_names"], data["clause_lits"], data["clause_offsets"], data["file_hash"])
+
+
+# rule bases parsed in this process, keyed by (path, modification time, size)
+rule_base_cache = {}
+
+
+def load_rule_base(rules_file, cache_dir=None):
+    '''
+    Returns the parsed rule base for a rules file, parsing it at most once per process.
+    With cache_dir set, the parsed arrays are also stored on disk under the file's sha1 hash
+    so later processes can skip parsing entirely.
+    '''
+    stat = os.stat(rules_file)
+    key = (os.path.realpath(rules_file), stat.st_mtime_ns, stat.st_size)
+    if key in rule_base_cache:
+        return rule_base_cache[key]
+
+    rule_base = None
+    if cache_dir is not None:
+        with open(rules_file, "rb") as f:
+            file_hash = hashlib.sha1(f.read()).hexdigest()
+        cache_file = os.path.join(cache_dir, f"{file_hash}.rules")
+        if os.path.exists(cache_file):
+            rule_base = RuleBase.load(cache_file)
+        else:
+            rule_base = RuleBase.from_file(rules_file, file_hash)
+            os.makedirs(cache_dir, exist_ok=True)
+            rule_base.save(cache_file)
+    else:
+        rule_base = RuleBase.from_file(rules_file)
+
+    rule_base_cache[key] = rule_base
+    return rule_base
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def budgeted(solve):
+    '''
+    Wraps a solve method: starts the budget clock and turns an exhausted budget into
+    status "UNKNOWN" with an empty solution instead of letting the search run on
+    '''
+    @functools.wraps(solve)
+    def wrapper(self, *args, **kwargs):
+        self.status = None
+        self.start_time = time.monotonic()
+        self.start_hooks()
+        try:
+            result = solve(self, *args, **kwargs)
+        except BudgetExceeded:
+            print("Budget exceeded, no answer")
+            self.status = "UNKNOWN"
+            self.solution = {}
+            return None
+        finally:
+            self.stop_hooks()
+            self.timings["search"] += time.monotonic() - self.start_time
+        if self.status is None:
+            # from what the search returned: the model of a formula without variables is empty
+            self.status = "SAT" if result else "UNSAT"
+        return result
+    return wrapper
+
+
+def timed(phase):
+    '''
+    Adds the time spent in the decorated method to self.timings[phase]
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.timings[phase] += time.perf_counter() - start_time
+        return wrapper
+    return decorator
+
 
 class SATSolver():
-    def __init__(self, input_file):
+    def __init__(self, input_file, rule_base=None, givens=None, dimacs=None):
+        '''
+        input_file is a full DIMACS file. With a rule_base it only has to hold the puzzle's
+        givens as unit clauses, and with givens (DIMACS literals) or dimacs (the DIMACS text
+        itself, as bytes) it is only used as a name.
+        '''
+        # seconds spent per phase, see get_stats
+        self.timings = dict.fromkeys(("parse", "preprocess", "search", "verify", "write"), 0.0)
+        start_time = time.perf_counter()
+
         self.puzzle_file = input_file
         self.file_name = os.path.basename(input_file)
         self.puzzle_dimension = 1
-        self.clauses, self.all_literals = self.read_input(input_file)
+        self.rule_base = rule_base
+        self.givens = givens
+        # internal variables are numbered densely 1..N, var_names maps them back to DIMACS
+        self.var_names = [0]
+        self.var_ids = {}
+        # flat clause database: literals of clause i are clause_lits[clause_offsets[i]:clause_offsets[i + 1]]
+        self.clause_lits = array('i')
+        self.clause_offsets = array('i', [0])
+
+        if rule_base is not None:
+            self.var_names = list(rule_base.var_names)
+            self.var_ids = dict(rule_base.var_ids)
+            self.clause_lits = array('i', rule_base.clause_lits)
+            self.clause_offsets = array('i', rule_base.clause_offsets)
+
+        # set once preprocess() replaced the clause database with a simplified one
+        self.preprocessor = None
+        self.original_clause_lits = None
+        self.original_clause_offsets = None
+
+        if givens is not None:
+            self.num_clauses, self.all_literals = self.load_clauses((literal,) for literal in givens)
+        elif dimacs is not None:
+            num_vars, literals = self.tokenize_dimacs_text(dimacs)
+            self.num_clauses, self.all_literals = self.load_literals(literals, num_vars)
+        else:
+            self.num_clauses, self.all_literals = self.read_input(input_file)
+        self.timings["parse"] = time.perf_counter() - start_time
         self.solution_folder = f"{self.puzzle_dimension}x{self.puzzle_dimension}"
         self.sol_file = ""
         self.solution = set()
         self.back_tracks = 0
+        # "SAT", "UNSAT", or "UNKNOWN" when a budget ran out
+        self.status = None
+        self.time_limit = None
+        self.max_decisions = None
+        self.max_conflicts = None
+        self.incremental_ready = False
+        # optional instrumentation, see set_hooks
+        self.callback = None
+        self.profile = False
+        self.trace_memory = False
+        self.profiler = None
+        self.peak_memory = None
+        self.tracing_started = False
+
+    def set_budget(self, time_limit=None, max_decisions=None, max_conflicts=None):
+        '''
+        Limits the next solve call to time_limit seconds, max_decisions decisions and
+        max_conflicts conflicts (back tracks). None means unlimited.
+        '''
+        self.time_limit = time_limit
+        self.max_decisions = max_decisions
+        self.max_conflicts = max_conflicts
+
+    def set_hooks(self, callback=None, profile=False, trace_memory=False):
+        '''
+        Instruments the next solve calls. callback(event, solver) is called on every "decision",
+        "conflict" and "restart". With profile the search runs under cProfile (self.profiler),
+        with trace_memory its peak allocation is measured with tracemalloc.
+        '''
+        self.callback = callback
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+    def start_hooks(self):
+        if self.trace_memory:
+            # somebody else may be tracing already, then only the peak is reset
+            self.tracing_started = not tracemalloc.is_tracing()
+            if self.tracing_started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profile:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_hooks(self):
+        if self.profile:
+            self.profiler.disable()
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self.tracing_started:
+                tracemalloc.stop()
+
+    def get_stats(self):
+        '''
+        Counters of the last search, the size of the clause database and the seconds spent
+        on parse, preprocess, search, verify and write
+        '''
+        stats = {"status": self.status, "back_tracks": self.back_tracks}
+        # the counters only exist once a solve method built the engine
+        if hasattr(self, "arena"):
+            stats.update({
+                "decisions": self.decisions,
+                "propagations": self.propagations,
+                "conflicts": self.conflicts,
+                "restarts": self.restarts,
+                "pure_literals": self.pure_literals,
+                "max_depth": self.max_depth,
+                "learnts": len(self.learnts),
+                "deleted_learnts": self.deleted_learnts,
+                "clause_db_bytes": self.clause_db_bytes(),
+            })
+        if self.peak_memory is not None:
+            stats["peak_memory"] = self.peak_memory
+        stats["timings"] = dict(self.timings)
+        return stats
+
+    def check_budget(self):
+        if ((self.max_decisions is not None and self.decisions >= self.max_decisions)
+                or (self.max_conflicts is not None and self.conflicts >= self.max_conflicts)
+                or (self.time_limit is not None and time.monotonic() - self.start_time >= self.time_limit)):
+            raise BudgetExceeded()
+
+    @staticmethod
+    def tokenize_dimacs(input_file, chunk_size=1 << 22):
+        '''
+        Memory-maps a DIMACS file and bulk-converts it, chunk by chunk, into one flat
+        array('i') of literals where a 0 terminates every clause.
+        Returns the variable count from the "p cnf" header (0 if there is none) and the array.
+        '''
+        num_vars = 0
+        literals = array('i')
+
+        with open(input_file, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return num_vars, literals
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                while start < size:
+                    # cut chunks on line boundaries so no token is split in two
+                    end = min(start + chunk_size, size)
+                    if end < size:
+                        newline = mm.find(b"\n", end)
+                        end = size if newline == -1 else newline + 1
+                    chunk = mm[start:end]
+                    start = end
+                    num_vars = SATSolver.tokenize_chunk(chunk, literals) or num_vars
+
+        # tolerate a missing terminator on the last clause
+        if literals and literals[-1] != 0:
+            literals.append(0)
+
+        return num_vars, literals
+
+    @staticmethod
+    def tokenize_chunk(chunk, literals):
+        '''
+        Appends the literals of a chunk of DIMACS text (bytes) to literals.
+        Returns the variable count of a "p cnf" header in the chunk, or None.
+        '''
+        num_vars = None
+        # header and comment lines are rare, only search for them when a chunk has one
+        if b"c" in chunk or b"p" in chunk:
+            header = DIMACS_HEADER.search(chunk)
+            if header:
+                num_vars = int(header.group(1))
+            chunk = DIMACS_NON_CLAUSE_LINE.sub(b"", chunk)
+
+        literals.extend(map(int, chunk.split()))
+        return num_vars
+
+    @staticmethod
+    def tokenize_dimacs_text(text):
+        '''
+        tokenize_dimacs for DIMACS text (bytes) that is already in memory
+        '''
+        literals = array('i')
+        num_vars = SATSolver.tokenize_chunk(text, literals) or 0
+        if literals and literals[-1] != 0:
+            literals.append(0)
+        return num_vars, literals
+
+    @staticmethod
+    def parse_dimacs(input_file):
+        '''
+        Reads in a DIMACS file and returns its clauses as tuples of signed ints
+        '''
+        _, literals = SATSolver.tokenize_dimacs(input_file)
 
+        clauses = []
+        start = 0
+        for end in range(len(literals)):
+            if literals[end] == 0:
+                if end > start:
+                    clauses.append(tuple(literals[start:end]))
+                start = end + 1
+
+        return clauses
 
     def read_input(self, input_file):
 
         '''
-        Reads in input files and converts to a set of clauses
+        Reads in input files and loads the clauses into the clause database
         '''
 
-        clauses = set()
-        all_literals = set()
+        num_vars, literals = self.tokenize_dimacs(input_file)
+        return self.load_literals(literals, num_vars)
 
-        with open(input_file, "r") as f:
-            for line in f:
-                if line.startswith("p"):
-                    continue
-                # remove trailing zero
-                line = line.replace('0\n', '')
-                line = line.strip()
-                literals = line.split(' ')
-                clause = tuple(literals)
-                for literal in literals:
-                    literal = literal.replace('-', '')
-                    all_literals.add(literal)
-                if len(clause) == 0:
-                    continue
-                clauses.add(clause)
+    def load_literals(self, literals, num_vars=0):
+        '''
+        Loads a flat, 0-terminated array of DIMACS literals into the flat clause database.
+        num_vars (from the header) sizes the renumbering table up front.
+        '''
+        var_ids = self.var_ids
+        var_names = self.var_names
+
+        # new variables get internal numbers in order of first appearance
+        for name in dict.fromkeys(map(abs, literals)):
+            if name and name not in var_ids:
+                var_ids[name] = len(var_names)
+                var_names.append(name)
+
+        # renumbering table indexed by the signed DIMACS literal, negative
+        # literals use the upper half through python's negative indexing
+        max_name = max(num_vars, max(var_ids, default=0))
+        table = [0] * (2 * max_name + 1)
+        for name, var in var_ids.items():
+            table[name] = var
+            table[-name] = -var
+        renumbered = array('i', map(table.__getitem__, literals))
+
+        # the raw bytes of every clause serve as its key, a dict keeps the first
+        # occurrence order while dropping duplicate clauses
+        raw = renumbered.tobytes()
+        itemsize = renumbered.itemsize
+        clauses = {}
+        start = 0
+        find_end = renumbered.index
+        while start < len(renumbered):
+            end = find_end(0, start)
+            if end > start:
+                clauses[raw[start * itemsize:end * itemsize]] = None
+            start = end + 1
+
+        # the surviving clauses are copied into the database in bulk
+        offsets = accumulate((len(clause) // itemsize for clause in clauses), initial=len(self.clause_lits))
+        next(offsets)
+        self.clause_lits.frombytes(b"".join(clauses))
+        self.clause_offsets.extend(offsets)
+
+        return self.database_summary()
+
+    def load_clauses(self, dimacs_clauses):
+        '''
+        Renumbers DIMACS clauses into internal variables and fills the flat clause database
+        '''
+        var_ids = self.var_ids
+        var_names = self.var_names
+
+        # dict keeps the first occurrence order while dropping duplicate clauses
+        clauses = {}
+        for dimacs_clause in dimacs_clauses:
+            clause = []
+            for literal in dimacs_clause:
+                name = abs(literal)
+                var = var_ids.get(name)
+                if var is None:
+                    var = len(var_names)
+                    var_ids[name] = var
+                    var_names.append(name)
+                clause.append(var if literal > 0 else -var)
+            clauses[tuple(clause)] = None
+
+        return self.store_clauses(clauses)
+
+    def store_clauses(self, clauses):
+        '''
+        Appends renumbered clauses to the flat clause database
+        '''
+        clause_lits = self.clause_lits
+        clause_offsets = self.clause_offsets
+        for clause in clauses:
+            clause_lits.extend(clause)
+            clause_offsets.append(len(clause_lits))
+
+        return self.database_summary()
 
+    def database_summary(self):
+        '''
+        Returns the clause count and the set of variables, and sets the puzzle dimension
+        '''
+        all_literals = set(range(1, len(self.var_names)))
         self.puzzle_dimension = round(len(all_literals)**(1/3))
 
-        return clauses, all_literals
+        return len(self.clause_offsets) - 1, all_literals
+
+    @timed("preprocess")
+    def sudoku_preprocess(self, frontend=None):
+        '''
+        Runs the sudoku front end (singles and locked candidates over the exactly-one groups
+        of the rules) on the unit clauses and adds everything it derives as unit clauses.
+        A frontend built once from a shared rule base can be passed in.
+        Returns False if the givens contradict each other.
+        '''
+        if frontend is None:
+            frontend = SudokuFrontend(self.clause_lits, self.clause_offsets)
+        units = [clause[0] for clause in self.iter_clauses() if len(clause) == 1]
+        derived = frontend.propagate(units)
+        if derived is None:
+            return False
+
+        known = set(units)
+        self.num_clauses, self.all_literals = self.load_clauses(
+            (self.to_dimacs(literal),) for literal in derived if literal not in known)
+        return True
+
+    @timed("preprocess")
+    def preprocess(self, **options):
+        '''
+        Simplifies the clause database with the CNF preprocessor (probing, subsumption,
+        self-subsuming strengthening, bounded variable elimination). The original clauses
+        are kept for verification and models are extended back to every original variable.
+        Returns False if the formula was found unsatisfiable.
+        '''
+        self.preprocessor = CNFPreprocessor(self.iter_clauses(), **options)
+        satisfiable = self.preprocessor.run()
+
+        if self.original_clause_lits is None:
+            self.original_clause_lits = self.clause_lits
+            self.original_clause_offsets = self.clause_offsets
+        self.clause_lits = array('i')
+        self.clause_offsets = array('i', [0])
+        self.num_clauses, _ = self.store_clauses(self.preprocessor.simplified_clauses())
+        return satisfiable
+
+    def iter_clauses(self):
+        '''
+        Yields every clause of the flat clause database as a tuple of internal literals
+        '''
+        lits = self.clause_lits
+        offsets = self.clause_offsets
+        for i in range(len(offsets) - 1):
+            yield tuple(lits[offsets[i]:offsets[i + 1]])
+
+    def to_dimacs(self, literal):
+        '''
+        Maps an internal literal back to its DIMACS literal
+        '''
+        name = self.var_names[abs(literal)]
+        return name if literal > 0 else -name
 
     @staticmethod
     def rev_literal(literal):
         """
         Reverse a literal so it returns its opposite
         """
-        if '-' in literal:
-            return literal.replace('-','')
-        else:
-            return f"-{literal}"
-        
-    
-    def simplify_clauses(self, clauses, assignment):
-        simplified_clauses = set()
-        for clause in clauses:
-            new_clause = []
-            clause_satisfied = False
+        return -literal
 
+
+    def init_engine(self, native_amo=False):
+        '''
+        Builds the two-watched-literal propagation engine from the clause database.
+        With native_amo the exactly-one groups of the formula are propagated as at-most-one
+        constraints and their pairwise binary clauses are left out of the arena.
+        Returns False if the formula is already unsatisfiable at the root.
+        '''
+        num_vars = len(self.var_names) - 1
+        self.num_vars = num_vars
+        # only solve() may pick up where the previous search stopped
+        self.incremental_ready = False
+        self.root_unsat = False
+
+        # values and watches are indexed directly by a signed literal, negative
+        # literals land in the upper half of the list through python's negative indexing
+        self.values = [0] * (2 * num_vars + 1)
+        self.watches = [[] for _ in range(2 * num_vars + 1)]
+        self.level = [0] * (num_vars + 1)
+        self.reason = [None] * (num_vars + 1)
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+
+        # clause arena: every clause is stored as [size, lit_1, ..., lit_size], the first
+        # two literals are the watched ones and a clause is referred to by its offset
+        self.arena = array('i')
+        self.clause_refs = []
+        self.occurs = [[] for _ in range(num_vars + 1)]
+
+        # learned clauses live behind the original ones in the arena, with an LBD and an
+        # activity each; reduce_learnts deletes the least useful half every now and then
+        self.learnts = []
+        self.learnt_lbd = {}
+        self.learnt_activity = {}
+        self.clause_inc = 1.0
+        self.max_learnts = 2000
+        self.deleted_learnts = 0
+
+        # branching state: activities for VSIDS and the last value of every variable for phase saving
+        self.activity = [0.0] * (num_vars + 1)
+        self.var_inc = 1.0
+        self.saved_phase = [False] * (num_vars + 1)
+        self.order_heap = None
+
+        self.decisions = 0
+        self.propagations = 0
+        self.conflicts = 0
+        self.restarts = 0
+        self.restart_schedule = RestartSchedule()
+        self.pure_literals = 0
+        # deepest decision level reached
+        self.max_depth = 0
+
+        # at-most-one groups: when one literal of a group becomes true the others become false.
+        # amo_watch lists the groups of every literal
+        self.amo_groups = []
+        self.amo_watch = amo_watch = [[] for _ in range(2 * num_vars + 1)]
+        if native_amo:
+            self.amo_groups = find_exactly_one_groups(self.clause_lits, self.clause_offsets)
+            for g, group in enumerate(self.amo_groups):
+                for literal in group:
+                    amo_watch[literal].append(g)
+
+        root_units = []
+        for clause in self.iter_clauses():
+            # a binary (-a -b) with a and b in one group is already enforced by that group,
+            # (-a -a) is the unit -a though
+            if (len(clause) == 2 and clause[0] != clause[1] and amo_watch[-clause[0]]
+                    and any(g in amo_watch[-clause[1]] for g in amo_watch[-clause[0]])):
+                continue
+            clause = tuple(dict.fromkeys(clause))
+            # tautologies are always satisfied
+            if any(-literal in clause for literal in clause):
+                continue
+            if len(clause) == 0:
+                return False
+            if len(clause) == 1:
+                root_units.append(clause[0])
+                continue
+            cref = self.add_clause(clause)
             for literal in clause:
-                stripped_literal = literal.replace('-', '')
-                if stripped_literal in assignment:
-                    # literal satisfaction check
-                    if (assignment[stripped_literal] == ('-' not in literal)):
-                        # if clause is satisfied, we can toss it out
-                        clause_satisfied = True
-                        break
-                else:
-                    # if the literal is not in the assignment, keep it in the clause
-                    new_clause.append(literal)
+                self.occurs[abs(literal)].append(cref)
+
+        # an implication or conflict of an at-most-one group is the binary clause (-x -y), so conflict
+        # analysis can read it like any other reason: every variable gets a reusable slot
+        # [2, implied literal, -true literal] at amo_reason + 3 * var, plus one slot for conflicts
+        self.amo_reason = len(self.arena)
+        if self.amo_groups:
+            self.arena.extend(array('i', [2, 0, 0]) * (num_vars + 1))
+        self.amo_conflict = len(self.arena)
+        if self.amo_groups:
+            self.arena.extend(array('i', [2, 0, 0]))
+        self.learnt_start = len(self.arena)
+
+        for literal in root_units:
+            value = self.values[literal]
+            if value == -1:
+                return False
+            if value == 0:
+                self.enqueue(literal, None)
 
-            # keep clause if it hasn't been satisfied yet or if it is empty
-            if not clause_satisfied:
-                simplified_clauses.add(tuple(new_clause))
+        return self.propagate() is None
+
+    def add_clause(self, clause, learnt=False, lbd=0):
+        '''
+        Appends a clause of at least two literals to the arena and watches its first two literals
+        '''
+        cref = len(self.arena)
+        self.arena.append(len(clause))
+        self.arena.extend(clause)
+        self.watches[clause[0]].append(cref)
+        self.watches[clause[1]].append(cref)
+        if learnt:
+            self.learnts.append(cref)
+            self.learnt_lbd[cref] = lbd
+            self.learnt_activity[cref] = 0.0
+        else:
+            self.clause_refs.append(cref)
+        return cref
 
-        return simplified_clauses
+    def clause_at(self, cref):
+        '''
+        Returns the literals of the clause stored at cref
+        '''
+        return self.arena[cref + 1:cref + 1 + self.arena[cref]]
 
+    def decision_level(self):
+        return len(self.trail_lim)
 
-    def solve_dpll(self):
+    def enqueue(self, literal, reason):
         '''
-        Implement the DPLL algorithm
+        Makes a literal true on the current decision level
         '''
-        self.back_tracks = 0
+        var = abs(literal)
+        self.values[literal] = 1
+        self.values[-literal] = -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(literal)
+
+    def new_decision(self, literal):
+        '''
+        Opens a new decision level and assigns the decision literal on it
+        '''
+        self.check_budget()
+        self.decisions += 1
+        self.trail_lim.append(len(self.trail))
+        if len(self.trail_lim) > self.max_depth:
+            self.max_depth = len(self.trail_lim)
+        if self.callback is not None:
+            self.callback("decision", self)
+        self.enqueue(literal, None)
+
+    def backtrack(self, level):
+        '''
+        Undoes every assignment above the given decision level by unwinding the trail
+        '''
+        if len(self.trail_lim) <= level:
+            return
+        values = self.values
+        reason = self.reason
+        saved_phase = self.saved_phase
+        order_heap = self.order_heap
+        trail = self.trail
+        limit = self.trail_lim[level]
+        for i in range(len(trail) - 1, limit - 1, -1):
+            literal = trail[i]
+            var = abs(literal)
+            values[literal] = 0
+            values[-literal] = 0
+            reason[var] = None
+            saved_phase[var] = literal > 0
+            if order_heap is not None:
+                order_heap.insert(var)
+        del trail[limit:]
+        del self.trail_lim[level:]
+        self.qhead = limit
+
+    def propagate(self):
+        '''
+        Runs unit propagation over the watched literals.
+        Returns the reference of a conflicting clause, or None if no conflict was found.
+        '''
+        arena = self.arena
+        values = self.values
+        watches = self.watches
+        trail = self.trail
+        amo_groups = self.amo_groups
+        amo_watch = self.amo_watch
+        amo_reason = self.amo_reason
+
+        while self.qhead < len(trail):
+            false_literal = -trail[self.qhead]
+            self.qhead += 1
+            self.propagations += 1
+
+            # every other literal of an at-most-one group with a true literal is false
+            for g in amo_watch[-false_literal]:
+                for other in amo_groups[g]:
+                    if other == -false_literal or values[other] == -1:
+                        continue
+                    if values[other] == 1:
+                        cref = self.amo_conflict
+                        arena[cref + 1] = -other
+                        arena[cref + 2] = false_literal
+                        self.qhead = len(trail)
+                        return cref
+                    cref = amo_reason + 3 * abs(other)
+                    arena[cref + 1] = -other
+                    arena[cref + 2] = false_literal
+                    self.enqueue(-other, cref)
+
+            # only clauses watching the literal that just became false need a visit
+            watch_list = watches[false_literal]
+            i = j = 0
+            n = len(watch_list)
+            while i < n:
+                cref = watch_list[i]
+                i += 1
+
+                # keep the false literal in the second watch position
+                if arena[cref + 1] == false_literal:
+                    arena[cref + 1] = arena[cref + 2]
+                    arena[cref + 2] = false_literal
+                first = arena[cref + 1]
+
+                # clause is already satisfied by the other watch
+                if values[first] == 1:
+                    watch_list[j] = cref
+                    j += 1
+                    continue
 
-        def recursive_solve(partial_assignment, clauses):
-            
-            # if all clauses have been solved
-            if len(clauses) == 0:
-                self.solution = partial_assignment
-                assert self.check_partial_assignment(self.solution, self.clauses) == True
-                return True
-            
-            # if there are any empty clauses, return false
-            for clause in clauses:
-                if len(clause) == 0:
-                    self.back_tracks += 1
-                    return False
-                
-            # if there are unit clauses
-            for clause in clauses:
-                if len(clause) == 1:
-                    # add literal to partial assigment
-                    (lit,) = clause
-
-                    # stripped literal
-                    strp_lit = lit.replace('-','')
-
-                    # assign the literal its appropriate value
-                    partial_assignment[strp_lit] = ('-' not in lit)
-
-            # add all the literals in the remaining clauses to a set
-            pure_literals = set()
-
-            for clause in clauses:
-                for literal in clause:
-                   strp_lit = literal.replace('-','')
-                   if strp_lit not in partial_assignment:
-                        pure_literals.add(literal)    
-
-            for literal in pure_literals:
-                # reversed literal (with '-' if without and vice versa)
-                rev_lit = self.rev_literal(literal)
-                strp_lit = literal.replace('-','')
-                if (rev_lit not in pure_literals):
-                    partial_assignment[strp_lit] = ('-' not in literal)
-
-            # go through each clause, only keep those that have not been satisfied
-            new_clauses = self.simplify_clauses(clauses, partial_assignment)
-
-            assigned_literals = set(partial_assignment.keys())
-            unassigned_literals = self.all_literals.difference(assigned_literals)
-
-            # if there are no more literals to assign
-            if len(unassigned_literals) == 0:
-                return recursive_solve(partial_assignment.copy(), new_clauses.copy())
-
-            # get the next literal from unassigned literals
-            next_literal = sorted(unassigned_literals).pop(0)
-
-            partial_assignment[next_literal] = False
-            if recursive_solve(partial_assignment.copy(), new_clauses.copy()):
+                # look for a replacement watch that is not false
+                for k in range(cref + 3, cref + 1 + arena[cref]):
+                    other = arena[k]
+                    if values[other] != -1:
+                        arena[cref + 2] = other
+                        arena[k] = false_literal
+                        watches[other].append(cref)
+                        break
+                else:
+                    # no replacement: the clause is unit or conflicting
+                    watch_list[j] = cref
+                    j += 1
+                    if values[first] == -1:
+                        while i < n:
+                            watch_list[j] = watch_list[i]
+                            j += 1
+                            i += 1
+                        del watch_list[j:]
+                        self.qhead = len(trail)
+                        return cref
+                    self.enqueue(first, cref)
+
+            del watch_list[j:]
+
+        return None
+
+    def clause_satisfied(self, cref):
+        values = self.values
+        for k in range(cref + 1, cref + 1 + self.arena[cref]):
+            if values[self.arena[k]] == 1:
                 return True
-            else:
-                partial_assignment[next_literal] = True
-                return recursive_solve(partial_assignment.copy(), new_clauses.copy())
+        return False
 
-        return recursive_solve({}, self.clauses.copy())
+    def assign_pure_literals(self):
+        '''
+        Assigns every literal that only occurs with one polarity in the clauses
+        that are not yet satisfied. Only used at the root of the search.
+        '''
+        arena = self.arena
+        values = self.values
+        polarity = {}
+        for cref in self.clause_refs:
+            if self.clause_satisfied(cref):
+                continue
+            for k in range(cref + 1, cref + 1 + arena[cref]):
+                literal = arena[k]
+                if values[literal] == 0:
+                    polarity[abs(literal)] = polarity.get(abs(literal), 0) | (1 if literal > 0 else 2)
+
+        for var, seen in polarity.items():
+            if seen != 3:
+                self.enqueue(var if seen == 1 else -var, None)
+                self.pure_literals += 1
+
+        return self.propagate() is None
+
+    def lowest_unassigned(self):
+        values = self.values
+        for var in range(1, self.num_vars + 1):
+            if values[var] == 0:
+                return var
+        return None
+
+    def pick_branch_literal(self):
+        '''
+        Chooses the next decision literal: the most active unassigned variable with its
+        saved phase when VSIDS is enabled, otherwise the lowest unassigned variable set to False
+        '''
+        order_heap = self.order_heap
+        if order_heap is None:
+            var = self.lowest_unassigned()
+            return None if var is None else -var
+
+        values = self.values
+        while order_heap:
+            var = order_heap.pop()
+            if values[var] == 0:
+                return var if self.saved_phase[var] else -var
+        return None
+
+    def model(self):
+        '''
+        Returns the current assignment as a dict of internal variable -> bool
+        '''
+        values = self.values
+        model = {var: values[var] == 1 for var in range(1, self.num_vars + 1)}
+        if self.preprocessor is not None:
+            self.preprocessor.extend_model(model)
+        return model
 
-    def solve_heuristic_1(self):
-        """
-        Implement first heuristic
-        """
-        self.back_tracks = 0
 
-        def recursive_solve(partial_assignment, clauses):
+    def dpll_search(self, choose_literal, count_exhausted):
+        '''
+        Chronological backtracking search over the shared assignment, driven by an explicit
+        stack instead of recursion. Every decision variable is tried False, then True.
+        choose_literal returns the next literal to branch on, or None once everything is assigned.
+        If count_exhausted is set, a variable for which both values failed adds a back track too.
+        '''
+        # one frame per open decision: [variable, number of values tried so far]
+        stack = []
+
+        while True:
+            next_literal = choose_literal()
 
-            # if all clauses have been solved
-            if len(clauses) == 0:
-                self.solution = partial_assignment
+            # if there are no more literals to assign, all clauses have been solved
+            if next_literal is None:
+                self.solution = self.model()
                 return True
 
-            # if there is an empty clause, the formula is false so return false
-            for clause in clauses:
-                if len(clause) == 0:
-                    self.back_tracks += 1
-                    return False
+            stack.append([abs(next_literal), 0])
 
-            for clause in clauses:
-                if len(clause) == 1:
-                    (lit,) = clause
-                    stripped_literal = lit.replace('-', '')
-                    # print(f"adding unit clause: {clause} to partial assignment")
-                    partial_assignment[stripped_literal] = ('-' not in lit)
-                    assert partial_assignment[stripped_literal] == ('-' not in lit)
-
-            # clauses = simplify_clauses(clauses, partial_assignment)
-
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-            #     raise Exception("PA not valid after unit clause assignment!")
-
-            # add all the literals in the remaining clauses to a set
-            pure_literals = set()
-
-            for clause in clauses:
-                for literal in clause:
-                   strp_lit = literal.replace('-','')
-                   if strp_lit not in partial_assignment:
-                        pure_literals.add(literal)    
-
-            for literal in pure_literals:
-                # reversed literal (with '-' if without and vice versa)
-                rev_lit = self.rev_literal(literal)
-                strp_lit = literal.replace('-','')
-                if (rev_lit not in pure_literals):
-                    partial_assignment[strp_lit] = ('-' not in literal)
-
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-            #     raise Exception("PA not valid after pure literal assignment!")
-            
-            # clauses = simplify_clauses(clauses, partial_assignment)
+            while stack:
+                frame = stack[-1]
+                var, tried = frame
 
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-            #     raise Exception("PA not valid after simplification!")
+                # both values failed, go back to the previous decision
+                if tried == 2:
+                    stack.pop()
+                    if count_exhausted:
+                        self.back_tracks += 1
+                    continue
 
-            # choose the literal with the highest frequency
-            literal_frequency = {}
-            for clause in clauses:
-                for literal in clause:
-                    if literal not in partial_assignment:
-                        literal_frequency[literal] = literal_frequency.get(literal, 0) + 1
+                # frame k decides on level k + 1, so undo everything above level k first
+                frame[1] += 1
+                self.backtrack(len(stack) - 1)
+                self.new_decision(var if tried == 1 else -var)
 
-            if len(literal_frequency) == 0:
-                print(f"literal frequency is 0, partial assignment: {len(partial_assignment)}")
+                if self.propagate() is None:
+                    break
 
-            # if all literals have already been assigned
-            if not literal_frequency:
-                if self.check_partial_assignment(partial_assignment, clauses):
-                    self.solution = partial_assignment
-                    return True
-                else:
-                    self.back_tracks += 1
-                    return False
-            
-            # choose the literal with the highest frequency to break ties
-            next_literal = max(literal_frequency, key=literal_frequency.get)
+                # propagation produced an empty clause
+                self.conflicts += 1
+                self.back_tracks += 1
+                if self.callback is not None:
+                    self.callback("conflict", self)
+            else:
+                return False
+
+    def choose_lowest_literal(self):
+        return self.lowest_unassigned()
+
+    def choose_most_frequent_literal(self):
+        '''
+        Chooses the literal with the highest frequency in the clauses that are not yet satisfied
+        '''
+        arena = self.arena
+        values = self.values
+        literal_frequency = {}
+        for cref in self.clause_refs:
+            if self.clause_satisfied(cref):
+                continue
+            for k in range(cref + 1, cref + 1 + arena[cref]):
+                literal = arena[k]
+                if values[literal] == 0:
+                    literal_frequency[literal] = literal_frequency.get(literal, 0) + 1
+
+        # if all literals in the open clauses have been assigned
+        if not literal_frequency:
+            return self.lowest_unassigned()
+
+        return max(literal_frequency, key=literal_frequency.get)
+
+    def choose_neighbor_literal(self):
+        '''
+        Chooses the literal that most often shares an open clause with the last literal assigned
+        '''
+        # the last literal assigned is the most recent one on the trail
+        last_literal_assigned = abs(self.trail[-1]) if self.trail else None
+
+        arena = self.arena
+        values = self.values
+        nei_literal_frequency = {}
+        if last_literal_assigned is not None:
+            for cref in self.occurs[last_literal_assigned]:
+                if self.clause_satisfied(cref):
+                    continue
+                for k in range(cref + 1, cref + 1 + arena[cref]):
+                    neighbor = arena[k]                              #all of these literals are  neighbors
+                    if abs(neighbor) != last_literal_assigned and values[neighbor] == 0:
+                        nei_literal_frequency[neighbor] = nei_literal_frequency.get(neighbor, 0) + 1
 
-            stripped_literal = next_literal.replace('-', '')
+        # if there are no neighboring literals of the last literal assigned, just choose the first one
+        if not nei_literal_frequency:
+            return self.lowest_unassigned()
 
-            # Try assigning False, then True
-            for value in [False, True]:
-                # new_partial_assignment[stripped_literal] = value if '-' not in next_literal else not value
-                partial_assignment[stripped_literal] = value
-                new_clauses = simplify_clauses(clauses, partial_assignment)
+        # if there are neighboring literals, choose the closest literal
+        return max(nei_literal_frequency, key=nei_literal_frequency.get)
 
-                # Recurse with the new partial assignment and simplified clauses
-                if recursive_solve(partial_assignment.copy(), new_clauses):
-                    return True
-            
+
+    @budgeted
+    def solve_dpll(self):
+        '''
+        Implement the DPLL algorithm
+        '''
+        self.back_tracks = 0
+
+        if not (self.init_engine() and self.assign_pure_literals()):
             self.back_tracks += 1
             return False
 
-        def simplify_clauses(clauses, assignment):
-            simplified_clauses = set()
-            for clause in clauses:
-                new_clause = []
-                clause_satisfied = False
-
-                for literal in clause:
-                    stripped_literal = literal.replace('-', '')
-                    if stripped_literal in assignment:
-                        # literal satisfaction check
-                        if ((('-' in literal) and assignment[stripped_literal] == False) or
-                                (('-' not in literal) and assignment[stripped_literal] == True)):
-                            # if clause is satisfied, we can toss it out
-                            clause_satisfied = True
-                            break
-                    else:
-                        # if the literal is not in the assignment, keep it in the clause
-                        new_clause.append(literal)
+        if not self.dpll_search(self.choose_lowest_literal, count_exhausted=False):
+            return False
 
-                # keep clause if it hasn't been satisfied yet or if it is empty
-                if not clause_satisfied:
-                    simplified_clauses.add(tuple(new_clause))
+        assert self.check_partial_assignment(self.solution, self.iter_clauses()) == True
+        return True
 
-            return simplified_clauses
+    @budgeted
+    def solve_heuristic_1(self):
+        """
+        Implement first heuristic
+        """
+        self.back_tracks = 0
 
         # solve puzzle
-        if not recursive_solve({}, self.clauses.copy()):
+        if not (self.init_engine() and self.assign_pure_literals()
+                and self.dpll_search(self.choose_most_frequent_literal, count_exhausted=True)):
             print("No solution found")
             self.solution = {}
+            return False
         # self.write_output()
+        return True
 
+    @budgeted
     def solve_heuristic_2(self):
         """
         Implement first heuristic
         """
 
-        def recursive_solve(partial_assignment, clauses, last_literal_assigned):
+        # solve puzzle
+        if not (self.init_engine() and self.assign_pure_literals()
+                and self.dpll_search(self.choose_neighbor_literal, count_exhausted=True)):
+            print("No solution found")
+            self.solution = {}
+            return False
+        return True
 
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-                # raise Exception("PA not valid after unit clause assignment!")
+    def analyze(self, conflict):
+        '''
+        First-UIP conflict analysis over the implication graph stored in the trail and reasons.
+        Returns the learned clause (asserting literal first) and the level to backjump to.
+        '''
+        arena = self.arena
+        level = self.level
+        reason = self.reason
+        trail = self.trail
+        learnt_activity = self.learnt_activity
+        seen = [False] * (self.num_vars + 1)
+        current_level = self.decision_level()
+
+        learnt = [0]
+        counter = 0
+        p = 0
+        index = len(trail) - 1
+        cref = conflict
+
+        while True:
+            if cref in learnt_activity:
+                self.bump_clause(cref)
+            for k in range(cref + 1, cref + 1 + arena[cref]):
+                literal = arena[k]
+                var = abs(literal)
+                if var == abs(p) or seen[var] or level[var] == 0:
+                    continue
+                seen[var] = True
+                self.bump_variable(var)
+                if level[var] >= current_level:
+                    counter += 1
+                else:
+                    learnt.append(literal)
+
+            # walk back along the trail to the next literal involved in the conflict
+            while not seen[abs(trail[index])]:
+                index -= 1
+            p = trail[index]
+            index -= 1
+            seen[abs(p)] = False
+            counter -= 1
+            if counter == 0:
+                break
+            cref = reason[abs(p)]
+
+        # the first unique implication point becomes the asserting literal
+        learnt[0] = -p
+
+        if len(learnt) == 1:
+            return learnt, 0
+
+        # the second watch goes to the literal from the highest remaining level
+        highest = max(range(1, len(learnt)), key=lambda i: level[abs(learnt[i])])
+        learnt[1], learnt[highest] = learnt[highest], learnt[1]
+        return learnt, level[abs(learnt[1])]
+
+    def bump_variable(self, var):
+        '''
+        Raises the activity of a variable taking part in a conflict (EVSIDS)
+        '''
+        activity = self.activity
+        activity[var] += self.var_inc
+        if activity[var] > 1e100:
+            # rescale everything to keep the floats in range, the order is unchanged
+            for i in range(len(activity)):
+                activity[i] *= 1e-100
+            self.var_inc *= 1e-100
+        if self.order_heap is not None:
+            self.order_heap.increased(var)
+
+    def bump_clause(self, cref):
+        '''
+        Raises the activity of a learned clause taking part in a conflict
+        '''
+        learnt_activity = self.learnt_activity
+        learnt_activity[cref] += self.clause_inc
+        if learnt_activity[cref] > 1e20:
+            for other in learnt_activity:
+                learnt_activity[other] *= 1e-20
+            self.clause_inc *= 1e-20
+
+    def decay_activities(self, decay=0.95, clause_decay=0.999):
+        '''
+        Decays all activities at once by growing the increment used for future bumps
+        '''
+        self.var_inc /= decay
+        self.clause_inc /= clause_decay
 
-            # if all clauses have been solved
-            if len(clauses) == 0:
-                self.solution = partial_assignment
-                return True
+    def reduce_learnts(self):
+        '''
+        Deletes the less useful half of the learned clauses: the ones with the highest LBD,
+        less active ones first among equal LBD. Glue clauses (LBD <= 2) and clauses that are
+        currently the reason of an assignment are kept. The arena is compacted afterwards.
+        '''
+        arena = self.arena
+        reason = self.reason
+        lbd = self.learnt_lbd
+        activity = self.learnt_activity
+
+        candidates = [cref for cref in self.learnts
+                      if lbd[cref] > 2 and reason[abs(arena[cref + 1])] != cref]
+        candidates.sort(key=lambda cref: (-lbd[cref], activity[cref]))
+        deleted = set(candidates[:len(self.learnts) // 2])
+        self.deleted_learnts += len(deleted)
+        self.compact_arena(deleted)
+
+    def compact_arena(self, deleted):
+        '''
+        Rebuilds the learned part of the arena without the deleted clauses and moves
+        every reference (watches, reasons, learned clause data) to the new offsets
+        '''
+        arena = self.arena
+        start = self.learnt_start
+        compacted = arena[:start]
+        moved = {}
+        for cref in self.learnts:
+            if cref in deleted:
+                continue
+            moved[cref] = len(compacted)
+            compacted.extend(arena[cref:cref + 1 + arena[cref]])
+        self.arena = compacted
+
+        # the original clauses stay where they are, only learned references move
+        for i, watch_list in enumerate(self.watches):
+            if any(cref >= start for cref in watch_list):
+                self.watches[i] = [cref if cref < start else moved[cref]
+                                   for cref in watch_list if cref < start or cref in moved]
+        reason = self.reason
+        for var in range(1, self.num_vars + 1):
+            cref = reason[var]
+            if cref is not None and cref >= start:
+                reason[var] = moved[cref]
+
+        self.learnts = list(moved.values())
+        self.learnt_lbd = {moved[cref]: self.learnt_lbd[cref] for cref in moved}
+        self.learnt_activity = {moved[cref]: self.learnt_activity[cref] for cref in moved}
+
+    def clause_db_bytes(self):
+        '''
+        Memory taken by the clause database: the arena plus the watch lists
+        '''
+        return (self.arena.buffer_info()[1] * self.arena.itemsize
+                + sum(sys.getsizeof(watch_list) for watch_list in self.watches))
+
+    @budgeted
+    def solve_cdcl(self, heuristic="lowest", restarts="none", native_amo=True):
+        '''
+        Conflict-driven clause learning: unit propagation over the watched literals, first-UIP
+        learning and non-chronological backjumping to the asserting level of the learned clause.
+        heuristic is either "lowest" (lowest unassigned variable) or "vsids",
+        restarts one of RestartSchedule.policies, native_amo see init_engine
+        '''
+        self.back_tracks = 0
+
+        if not self.init_engine(native_amo):
+            print("No solution found")
+            self.solution = {}
+            return False
+
+        self.set_heuristic(heuristic)
+        self.restart_schedule = RestartSchedule(restarts)
+        return self.cdcl_search()
 
-            # if there is an empty clause, the formula is false so return false
-            for clause in clauses:
-                if len(clause) == 0:
-                    self.back_tracks += 1
+    def set_heuristic(self, heuristic):
+        if heuristic == "vsids":
+            self.order_heap = VariableHeap(self.activity, range(1, self.num_vars + 1))
+        elif heuristic != "lowest":
+            raise Exception(f"Error, unknown branching heuristic {heuristic}!")
+
+    def cdcl_search(self, assumptions=()):
+        '''
+        The CDCL loop. assumptions (internal literals) are decided first, one per decision
+        level, so everything learned under them stays valid without them.
+        '''
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                self.back_tracks += 1
+                if self.callback is not None:
+                    self.callback("conflict", self)
+                self.check_budget()
+
+                # a conflict without any decisions means the formula is unsatisfiable
+                if self.decision_level() == 0:
+                    self.root_unsat = True
+                    print("No solution found")
+                    self.solution = {}
                     return False
 
-            # add unit clauses to partial assignment
-            for clause in clauses:
-                if len(clause) == 1:
-                    (lit,) = clause
-                    stripped_literal = lit.replace('-', '')
-                    partial_assignment[stripped_literal] = ('-' not in lit)
-                    assert partial_assignment[stripped_literal] == ('-' not in lit)
-                    last_literal_assigned = stripped_literal                                
-
-            # assign pure literals
-            literal_counts = {}
-            for clause in clauses:
-                for literal in clause:
-                    literal_counts[literal] = literal_counts.get(literal, 0) + 1
-
-            for literal in literal_counts.keys():
-                rev_literal = self.rev_literal(literal)
-                if rev_literal not in literal_counts:
-                    stripped_literal = literal.replace('-', '')
-                    partial_assignment[stripped_literal] = ('-' not in literal)
-                    assert partial_assignment[stripped_literal] == ('-' not in literal)
-                    last_literal_assigned = stripped_literal
-
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-            #     raise Exception("PA not valid after pure literal assignment!")
-
-            # choose the neighboring literal with the highest frequency
-            nei_literal_frequency = {}
-            for clause in clauses:
-                rev_last_literal_assigned = self.rev_literal(last_literal_assigned)
-                if (last_literal_assigned in clause) or (rev_last_literal_assigned in clause):
-                    for neighbor in clause:                          #all of these literals are  neighbors
-                        if (neighbor != last_literal_assigned) and (neighbor != rev_last_literal_assigned):
-                            if neighbor not in nei_literal_frequency:
-                                nei_literal_frequency[neighbor] = 0
-                            nei_literal_frequency[neighbor] += 1
-
-            # if not self.check_partial_assignment(partial_assignment, clauses):
-            #     raise Exception("PA not valid after simplification!")
-
-            next_literal = None
-
-            # if there are no neighboring literals of the last literal assigned
-            if not nei_literal_frequency:
-                # check to see if there are literals still left to assign
-                assigned_literals = set(partial_assignment.keys())
-                unassigned_literals = self.all_literals.difference(assigned_literals)  
-
-                if len(unassigned_literals) == 0:
-                    print("no neighbors to choose from!")
-                    if self.check_partial_assignment(partial_assignment, clauses):
-                        self.solution = partial_assignment
-                        return True
-                    else:
-                        self.back_tracks += 1
-                        return False
+                learnt, backjump_level = self.analyze(conflict)
+                lbd = self.lbd(learnt)
+                self.restart_schedule.conflict(lbd)
+                self.decay_activities()
+                self.backtrack(backjump_level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
                 else:
-                    # if there are, just choose the first one
-                    next_literal = sorted(unassigned_literals).pop(0)
-            else:           
-                # if there are neighboring literals, choose the closest literal
-                next_literal = max(nei_literal_frequency, key=nei_literal_frequency.get)
+                    self.enqueue(learnt[0], self.add_clause(learnt, learnt=True, lbd=lbd))
+            else:
+                if len(self.learnts) >= self.max_learnts:
+                    self.reduce_learnts()
+                    self.max_learnts += 300
+
+                if self.restart_schedule.due():
+                    # the saved phases bring the search straight back to where it was
+                    self.restart_schedule.restart()
+                    self.restarts += 1
+                    if self.callback is not None:
+                        self.callback("restart", self)
+                    self.backtrack(0)
+
+                next_literal = None
+                while self.decision_level() < len(assumptions):
+                    assumption = assumptions[self.decision_level()]
+                    if self.values[assumption] == 1:
+                        # already implied, keep the levels aligned with an empty one
+                        self.trail_lim.append(len(self.trail))
+                    elif self.values[assumption] == -1:
+                        print("No solution found under the assumptions")
+                        self.solution = {}
+                        return False
+                    else:
+                        next_literal = assumption
+                        break
 
-            assert next_literal != None
+                if next_literal is None:
+                    next_literal = self.pick_branch_literal()
 
-            stripped_literal = next_literal.replace('-', '')
+                # every variable is assigned without conflict
+                if next_literal is None:
+                    self.solution = self.model()
+                    return True
 
-            # Try assigning False, then True
-            for value in [False, True]:
-                # new_partial_assignment[stripped_literal] = value if '-' not in next_literal else not value
-                partial_assignment[stripped_literal] = value
-                last_literal_assigned = stripped_literal
-                new_clauses = self.simplify_clauses(clauses, partial_assignment)
+                self.new_decision(next_literal)
 
-                # Recurse with the new partial assignment and simplified clauses
-                if recursive_solve(partial_assignment.copy(), new_clauses, deepcopy(last_literal_assigned)):
-                    return True
-                
-            self.back_tracks += 1
-            return False
+    def lbd(self, clause):
+        '''
+        Literal block distance: the number of different decision levels in a clause
+        '''
+        level = self.level
+        return len({level[abs(literal)] for literal in clause})
 
-        # solve puzzle
-        if not recursive_solve({}, self.clauses.copy(), None):
+    @budgeted
+    def solve(self, assumptions=(), heuristic="vsids", restarts="none", native_amo=True):
+        '''
+        Incremental CDCL solving: the engine is built on the first call only, later calls
+        keep the learned clauses, activities and saved phases. assumptions are DIMACS
+        literals (e.g. a puzzle's givens) that only hold for this call.
+        '''
+        internal = []
+        for literal in assumptions:
+            var = self.var_ids.get(abs(literal))
+            if var is None:
+                raise Exception(f"Error, assumption {literal} is not a variable of the formula!")
+            internal.append(var if literal > 0 else -var)
+
+        if not self.incremental_ready:
+            self.root_unsat = not self.init_engine(native_amo)
+            self.set_heuristic(heuristic)
+            self.incremental_ready = True
+        else:
+            self.backtrack(0)
+            self.decisions = 0
+            self.propagations = 0
+            self.conflicts = 0
+            self.restarts = 0
+            self.pure_literals = 0
+            self.max_depth = 0
+        self.back_tracks = 0
+        self.restart_schedule = RestartSchedule(restarts)
+
+        if self.root_unsat:
             print("No solution found")
             self.solution = {}
-        self.write_output()
+            return False
+
+        return self.cdcl_search(internal)
 
+    def solve_vsids(self, restarts="none", native_amo=True):
+        '''
+        CDCL search branching on the most active variable (EVSIDS) with phase saving
+        '''
+        return self.solve_cdcl(heuristic="vsids", restarts=restarts, native_amo=native_amo)
 
+    @timed("write")
     def write_output(self):
         '''
         Write output to file in DIMAC format
         '''
         self.sol_file = f"solutions/{self.solution_folder}/sol_{self.file_name}"
+        os.makedirs(os.path.dirname(self.sol_file), exist_ok=True)
 
         with open(self.sol_file, "w") as f:
             f.write(f"p {len(self.all_literals)} {len(self.solution)}\n")
-            sorted_solution = sorted(self.solution)
+            # map internal variables back to their DIMACS names only here
+            sorted_solution = sorted(self.solution, key=lambda var: self.var_names[var])
             for assignment in sorted_solution:
                 if self.solution[assignment] == True:
-                    f.write(f"{assignment} 0\n")
+                    f.write(f"{self.var_names[assignment]} 0\n")
             for assignment in sorted_solution:
                 if self.solution[assignment] == False:
-                    f.write(f"-{assignment} 0\n")
+                    f.write(f"-{self.var_names[assignment]} 0\n")
 
 
+    @timed("verify")
+    def verify_model(self, model=None, quiet=False):
+        '''
+        Checks a model (internal variable -> bool, self.solution by default) against the
+        clause database in memory, without writing or re-reading any files.
+        quiet only returns the answer, without printing the verdict or the violated clauses.
+        '''
+        if model is None:
+            model = self.solution
+        num_vars = len(self.var_names) - 1
+        # only a formula without variables has the empty model
+        if not model and num_vars:
+            if not quiet:
+                print("No solution to verify!")
+            return False
+
+        # truth value of every signed literal, negative literals use the upper half of the list
+        truth = [0] * (2 * num_vars + 1)
+        for var, value in model.items():
+            truth[var if value else -var] = 1
+
+        # a preprocessed solver is checked against the clauses it was loaded with
+        clause_lits = self.clause_lits
+        offsets = self.clause_offsets
+        if self.original_clause_lits is not None:
+            clause_lits = self.original_clause_lits
+            offsets = self.original_clause_offsets
+
+        # number of true literals before every position of the flat clause array, a clause
+        # is satisfied when the count grows between its start and end offset
+        true_before = list(accumulate(map(truth.__getitem__, clause_lits), initial=0))
+        ends = map(true_before.__getitem__, offsets[1:])
+        starts = map(true_before.__getitem__, offsets[:-1])
+        if all(map(sub, ends, starts)):
+            if not quiet:
+                print("Solution is valid!")
+            return True
+        if quiet:
+            return False
+
+        for i in range(len(offsets) - 1):
+            if true_before[offsets[i + 1]] == true_before[offsets[i]]:
+                print(f"Clause {tuple(self.to_dimacs(literal) for literal in clause_lits[offsets[i]:offsets[i + 1]])} not satisfied!")
+        print("The above clauses were not followed!")
+        return False
+
     def check_partial_assignment(self, pa, clauses):
         for clause in clauses:
             clause_satisfied = False
             for literal in clause:
-                strp_literal = literal.replace('-','')
-                if (strp_literal not in pa) or ((strp_literal in pa) and (pa[strp_literal] == ('-' not in literal))):
+                strp_literal = abs(literal)
+                if (strp_literal not in pa) or ((strp_literal in pa) and (pa[strp_literal] == (literal > 0))):
                     clause_satisfied = True
                     continue
             if not clause_satisfied:
-                print(f"Clause {clause} not satisfied!")
+                print(f"Clause {tuple(self.to_dimacs(literal) for literal in clause)} not satisfied!")
                 print(pa)
                 return False
         return True
 
 
+    @timed("verify")
     def verify_solution(self, puzzle_file=None, sol_file=None):
+        '''
+        Audit check that re-reads the puzzle and the written solution file from disk,
+        verify_model does the same check in memory
+        '''
         if not puzzle_file:
             puzzle_file = self.puzzle_file
             if not puzzle_file:
@@ -426,15 +1508,24 @@ class SATSolver():
             if sol_file == "":
                 raise Exception("Error, no solution file provided to verify solution!")
             
-        puzzle_clauses, _ = self.read_input(puzzle_file)
-        sol_clauses, _ = self.read_input(sol_file)
+        if puzzle_file == self.puzzle_file and self.rule_base is not None:
+            # the puzzle file only holds the givens, the rules come from the shared rule base
+            puzzle_clauses = list(self.rule_base.iter_dimacs())
+            if self.givens is not None:
+                puzzle_clauses.extend((literal,) for literal in self.givens)
+            else:
+                puzzle_clauses.extend(self.parse_dimacs(puzzle_file))
+        else:
+            puzzle_clauses = self.parse_dimacs(puzzle_file)
+        # the solution file only holds unit clauses, one per assigned literal
+        sol_literals = {clause[0] for clause in self.parse_dimacs(sol_file) if len(clause) == 1}
 
         rules_broken = False
 
         for clause in puzzle_clauses:
             clause_satisfied = False
             for literal in clause:
-                if (literal,) in sol_clauses:
+                if literal in sol_literals:
                     clause_satisfied = True
                     continue
             if not clause_satisfied:
@@ -450,34 +1541,75 @@ class SATSolver():
 
 
 if __name__ == "__main__":
-    algo_number = int(sys.argv[1])
-    input_file = sys.argv[2]
-    solver = SATSolver(input_file)
-
-    try:
-        sol_file = sys.argv[3]
-    except:
-        sol_file = None
-
+    # python SAT_solver.py algo input_file [sol_file] [--rules N] [--cache FILE] [--restarts policy] [--stats] [--profile] [--trace-memory]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("algo_number", type=int)
+    parser.add_argument("input_file")
+    parser.add_argument("sol_file", nargs="?")
+    parser.add_argument("--rules", type=int, metavar="N",
+                        help="generate the NxN sudoku rules in memory, input_file only holds the givens")
+    parser.add_argument("--restarts", choices=RestartSchedule.policies, default="none",
+                        help="restart policy for the CDCL solvers (5 and 6)")
+    parser.add_argument("--stats", action="store_true", help="print the search counters and time per phase")
+    parser.add_argument("--profile", action="store_true", help="run the search under cProfile")
+    parser.add_argument("--trace-memory", action="store_true", help="measure the peak allocation of the search")
+    parser.add_argument("--cache", metavar="FILE",
+                        help="solution cache shared between runs, answers puzzles equivalent to a solved one")
+    args = parser.parse_args()
+
+    algo_number = args.algo_number
+    input_file = args.input_file
+    sol_file = args.sol_file
     start_time = time.time()
 
-    match algo_number:
-        case 1:
-            solver.solve_dpll()
-        case 2:
-            solver.solve_heuristic_1()
-        case 3:
-            solver.solve_heuristic_2()
-        case 4:
-            solver.verify_solution(input_file, sol_file)
-    
+    if args.rules:
+        from sudoku_rules import generate_rules
+        solver = SATSolver(input_file, rule_base=generate_rules(args.rules))
+    else:
+        solver = SATSolver(input_file)
+    solver.set_hooks(profile=args.profile, trace_memory=args.trace_memory)
+
+    cache = None
+    cached = False
+    if args.cache and algo_number != 4:
+        from solution_cache import SolutionCache
+        cache = SolutionCache(args.cache)
+        cached = cache.fetch(solver)
+
+    if cached:
+        print("Solution from the cache")
+    else:
+        match algo_number:
+            case 1:
+                solver.solve_dpll()
+            case 2:
+                solver.solve_heuristic_1()
+            case 3:
+                solver.solve_heuristic_2()
+            case 4:
+                solver.verify_solution(input_file, sol_file)
+            case 5:
+                solver.solve_cdcl(restarts=args.restarts)
+            case 6:
+                solver.solve_vsids(restarts=args.restarts)
+    if cache is not None:
+        if not cached:
+            cache.remember(solver)
+        cache.close()
+
     if algo_number != 4:
         solver.write_output()
-        solver.verify_solution()
+        solver.verify_model()
+        if algo_number in (5, 6) and not cached:
+            print(f"Conflicts: {solver.conflicts}, restarts: {solver.restarts}, "
+                  f"learned clauses: {len(solver.learnts)} ({solver.deleted_learnts} deleted)")
+        if not cached:
+            print(f"Back tracks: {solver.back_tracks}, clause database: {solver.clause_db_bytes()} bytes")
 
     end_time = time.time()
     elapsed_time = end_time - start_time
+    if args.stats or args.trace_memory:
+        print(solver.get_stats())
+    if args.profile and solver.profiler is not None:
+        pstats.Stats(solver.profiler).sort_stats("cumulative").print_stats(20)
     print(f"Elapsed time: {elapsed_time} seconds")
-
-    if algo_number != 4:
-        solver.write_output()
\ No newline at end of file
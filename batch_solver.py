@@ -0,0 +1,348 @@
+import sys
+import time
+from array import array
+from itertools import chain, combinations, compress
+
+from SAT_solver import SATSolver, RuleBase, BudgetExceeded
+from encoder.batch_encode import BatchEncoder, SYMBOLS, variable_base
+from sudoku_rules import sudoku_groups
+
+
+class BatchSolver():
+    """
+    Solves many n x n sudokus in lock step. The candidates are bit-sliced over the puzzles:
+    cand[cell * n + v] is one integer whose bit k says value v + 1 is still possible in that
+    cell of puzzle k, so every elimination step below runs for all puzzles in a single
+    big-integer operation. Singles and locked candidates are propagated to a fixpoint, open
+    puzzles branch in lock step as well (see solve_batch), and only the puzzles that are still
+    open after that (the residue) are searched one by one with a SATSolver.
+    With a time_limit (seconds for the whole batch) the puzzles not answered in time get
+    status "UNKNOWN" instead of letting the search run on.
+    """
+    def __init__(self, n, method="solve_vsids", max_depth=16, time_limit=None):
+        self.n = n
+        # solver method for the residue and the number of lock-step branching levels before it
+        self.method = method
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.deadline = None
+        # "SAT", "UNSAT" or "UNKNOWN" per puzzle of the last solve call
+        self.statuses = []
+        # the row, column and box groups of value 1 list the cells of every unit
+        self.units = [[(var - 1) // n for var in group] for group in sudoku_groups(n)[n * n:]
+                      if (group[0] - 1) % n == 0]
+        # every box meets a row or column in a segment: (segment, rest of the line, rest of the box)
+        lines = self.units[:2 * n]
+        boxes = [set(box) for box in self.units[2 * n:]]
+        self.segments = []
+        for line in lines:
+            for box in boxes:
+                segment = [cell for cell in line if cell in box]
+                if segment:
+                    self.segments.append((segment, [cell for cell in line if cell not in box],
+                                          [cell for cell in sorted(box) if cell not in segment]))
+        self.rounds = 0
+        # puzzles solved by propagation alone, puzzles that needed branching, SATSolver runs
+        self.propagated = 0
+        self.branched = 0
+        self.searched = 0
+
+    def load(self, values, num_puzzles):
+        '''
+        Candidate bits of every cell and value: an empty cell allows every value, a given only its own
+        '''
+        n = self.n
+        cells = n * n
+        cand = []
+        for cell in range(cells):
+            # byte k of column is the value of this cell in puzzle k
+            column = values[cell::cells]
+            for v in range(1, n + 1):
+                table = bytearray(b"0") * 256
+                table[0] = table[v] = ord("1")
+                cand.append(int(column.translate(table)[::-1], 2))
+        return cand
+
+    def propagate(self, cand, full):
+        '''
+        Naked and hidden singles and locked candidates for all puzzles at once, until nothing changes.
+        Returns the bits of the puzzles that ran into a contradiction.
+        '''
+        n = self.n
+        cells = n * n
+        dead = 0
+        while True:
+            self.check_budget()
+            self.rounds += 1
+            previous = list(cand)
+
+            # fixed[cell]: puzzles where the cell has exactly one candidate left
+            fixed = []
+            for cell in range(cells):
+                one = two = 0
+                for x in cand[cell * n:cell * n + n]:
+                    two |= one & x
+                    one |= x
+                dead |= full & ~one
+                fixed.append(one & ~two)
+
+            for unit in self.units:
+                for v in range(n):
+                    # naked singles: a value fixed in one cell of a unit leaves its other cells
+                    placed = clash = 0
+                    for cell in unit:
+                        single = cand[cell * n + v] & fixed[cell]
+                        clash |= placed & single
+                        placed |= single
+                    dead |= clash
+                    if placed:
+                        for cell in unit:
+                            cand[cell * n + v] &= ~(placed & ~fixed[cell])
+
+                    # hidden singles: a value with one place left in a unit takes that cell
+                    one = two = 0
+                    for cell in unit:
+                        x = cand[cell * n + v]
+                        two |= one & x
+                        one |= x
+                    dead |= full & ~one
+                    hidden = one & ~two
+                    if hidden:
+                        for cell in unit:
+                            h = cand[cell * n + v] & hidden & ~fixed[cell]
+                            if h:
+                                for w in range(cell * n, cell * n + n):
+                                    if w != cell * n + v:
+                                        cand[w] &= ~h
+
+            # locked candidates: a value confined to the segment in its box leaves the rest of the
+            # line (pointing), and a value confined to the segment in its line leaves the rest of the box
+            for segment, line_rest, box_rest in self.segments:
+                for v in range(n):
+                    in_segment = 0
+                    for cell in segment:
+                        in_segment |= cand[cell * n + v]
+                    if not in_segment:
+                        continue
+                    in_line = in_box = 0
+                    for cell in line_rest:
+                        in_line |= cand[cell * n + v]
+                    for cell in box_rest:
+                        in_box |= cand[cell * n + v]
+                    pointing = in_segment & ~in_box
+                    if pointing & in_line:
+                        for cell in line_rest:
+                            cand[cell * n + v] &= ~pointing
+                    claiming = in_segment & ~in_line
+                    if claiming & in_box:
+                        for cell in box_rest:
+                            cand[cell * n + v] &= ~claiming
+
+            if cand == previous:
+                return dead
+
+    @staticmethod
+    def spread(bits, num_puzzles, value=1):
+        '''
+        One byte per puzzle out of a bit-sliced integer: value where the bit of the puzzle is set, else 0
+        '''
+        flags = format(bits, f"0{num_puzzles}b")[::-1].encode()
+        return flags.translate(bytes.maketrans(b"01", bytes([0, value])))
+
+    def unpack(self, cand, num_puzzles):
+        '''
+        The grid of every puzzle as bytes, with the value of every cell that has a single
+        candidate and 0 elsewhere, plus the candidate flags (n * n * n bytes) of every puzzle
+        '''
+        n = self.n
+        columns = []
+        for cell in range(n * n):
+            one = two = 0
+            for x in cand[cell * n:cell * n + n]:
+                two |= one & x
+                one |= x
+            fixed = one & ~two
+            # a cell is fixed to one value at most, so the value bytes can be or-ed together
+            column = 0
+            for v in range(n):
+                column |= int.from_bytes(self.spread(cand[cell * n + v] & fixed, num_puzzles, v + 1), "big")
+            columns.append(column.to_bytes(num_puzzles, "big"))
+        cell_major = b"".join(columns)
+        candidate_major = b"".join(self.spread(x, num_puzzles) for x in cand)
+        return ([cell_major[k::num_puzzles] for k in range(num_puzzles)],
+                [candidate_major[k::num_puzzles] for k in range(num_puzzles)])
+
+    def check_budget(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise BudgetExceeded()
+
+    def residue_rules(self, grid, flags):
+        '''
+        Sudoku rules restricted to what propagation left open in one puzzle: exactly one value
+        per open cell and exactly one place per value still missing from a unit, over the
+        remaining candidates only. Variables keep their DIMACS names, so no givens are needed.
+        '''
+        n = self.n
+        base = variable_base(n)
+        var_ids = {}
+        var_names = [0]
+        open_cells = [cell for cell in range(n * n) if not grid[cell]]
+        for cell in open_cells:
+            for i in compress(range(cell * n, cell * n + n), flags[cell * n:cell * n + n]):
+                var_ids[i] = len(var_names)
+                var_names.append(base * base * (cell // n + 1) + base * (cell % n + 1) + i % n + 1)
+
+        groups = [[var_ids[i] for i in range(cell * n, cell * n + n) if flags[i]] for cell in open_cells]
+        for unit in self.units:
+            placed = {grid[cell] for cell in unit}
+            groups += [[var_ids[cell * n + v] for cell in unit if not grid[cell] and flags[cell * n + v]]
+                       for v in range(n) if v + 1 not in placed]
+        clause_lits = array('i')
+        clause_offsets = array('i', [0])
+        for group in groups:
+            clause_lits.extend(group)
+            clause_offsets.append(len(clause_lits))
+            for a, b in combinations(group, 2):
+                clause_lits.extend((-a, -b))
+                clause_offsets.append(len(clause_lits))
+        return RuleBase(var_names, clause_lits, clause_offsets, file_hash="residue")
+
+    def search(self, grid, flags):
+        '''
+        Completes one residue puzzle with a SATSolver on its open cells
+        '''
+        self.check_budget()
+        n = self.n
+        base = variable_base(n)
+        solver = SATSolver("residue", rule_base=self.residue_rules(grid, flags), givens=[])
+        if self.deadline is not None:
+            solver.set_budget(time_limit=self.deadline - time.monotonic())
+        getattr(solver, self.method)()
+        if solver.status == "UNKNOWN":
+            raise BudgetExceeded()
+        if solver.status != "SAT":
+            return None
+        solution = bytearray(grid)
+        for var, value in solver.solution.items():
+            if value:
+                name = solver.var_names[var]
+                solution[(name // (base * base) - 1) * n + name // base % base - 1] = name % base
+        return bytes(solution)
+
+    def solve_batch(self, values, num_puzzles, depth=0, previous_open=None):
+        '''
+        Propagates a batch in lock step. Puzzles left open are split on their cell with the
+        fewest candidates, one copy per candidate, and the copies of all puzzles are propagated
+        as the next batch. That goes on while the number of open puzzles keeps shrinking (it
+        grows when propagation kills too few branches) and at most max_depth levels deep.
+        The result of a puzzle is its solution, None if it has none, the list of its branch
+        results, or (grid, candidate flags) still to be searched.
+        '''
+        n = self.n
+        full = (1 << num_puzzles) - 1
+        cand = self.load(values, num_puzzles)
+        dead = self.propagate(cand, full)
+        grids, flags = self.unpack(cand, num_puzzles)
+
+        results = [None] * num_puzzles
+        open_puzzles = []
+        for k, grid in enumerate(grids):
+            if not dead >> k & 1:
+                if all(grid):
+                    results[k] = grid
+                else:
+                    open_puzzles.append(k)
+        branching = depth < self.max_depth and (previous_open is None or len(open_puzzles) < previous_open)
+
+        branches = []
+        for k in open_puzzles:
+            grid = grids[k]
+            if branching:
+                counts = {cell: sum(flags[k][cell * n:cell * n + n]) for cell in range(n * n) if not grid[cell]}
+                cell = min(counts, key=counts.__getitem__)
+                results[k] = []
+                for v in compress(range(n), flags[k][cell * n:cell * n + n]):
+                    branch = bytearray(grid)
+                    branch[cell] = v + 1
+                    branches.append((k, branch))
+            else:
+                results[k] = (grid, flags[k])
+
+        if branches:
+            branch_results = self.solve_batch(b"".join(branch for _, branch in branches), len(branches),
+                                              depth + 1, len(open_puzzles))
+            for (k, _), result in zip(branches, branch_results):
+                results[k].append(result)
+        return results
+
+    def resolve(self, result):
+        '''
+        Solution out of a solve_batch result, trying the branches of a puzzle in order
+        '''
+        if isinstance(result, tuple):
+            self.searched += 1
+            return self.search(*result)
+        if isinstance(result, list):
+            # the branches cover every candidate of a cell, no branch solution means no solution
+            for branch in result:
+                solution = self.resolve(branch)
+                if solution is not None:
+                    return solution
+            return None
+        return result
+
+    def solve(self, values, num_puzzles=None):
+        '''
+        Solves a batch of puzzles, given as their cell values (num_puzzles x n x n, row-major,
+        0 for an empty cell) either as one flat bytes object or as a list of grids (flat or as rows).
+        Returns the solution of every puzzle as n * n bytes, or None if it has none or was not
+        solved within the time limit (see self.statuses).
+        '''
+        if not isinstance(values, (bytes, bytearray)):
+            values = bytes(chain.from_iterable(
+                chain.from_iterable(grid) if isinstance(grid[0], (list, tuple)) else grid for grid in values))
+        cells = self.n * self.n
+        num_puzzles = num_puzzles or len(values) // cells
+        if len(values) != num_puzzles * cells or max(values, default=0) > self.n:
+            raise Exception(f"Error, the batch does not hold {num_puzzles} {self.n}x{self.n} puzzles!")
+        self.statuses = []
+        if not num_puzzles:
+            return []
+        self.deadline = time.monotonic() + self.time_limit if self.time_limit is not None else None
+
+        try:
+            results = self.solve_batch(values, num_puzzles)
+        except BudgetExceeded:
+            # out of time before the lock-step phase was over, no puzzle has an answer yet
+            self.statuses = ["UNKNOWN"] * num_puzzles
+            return [None] * num_puzzles
+        self.propagated += sum(isinstance(result, bytes) for result in results)
+        self.branched += sum(isinstance(result, list) for result in results)
+        solutions = []
+        for result in results:
+            try:
+                solution = self.resolve(result)
+                self.statuses.append("SAT" if solution is not None else "UNSAT")
+            except BudgetExceeded:
+                solution = None
+                self.statuses.append("UNKNOWN")
+            solutions.append(solution)
+        return solutions
+
+
+if __name__ == "__main__":
+    # python batch_solver.py puzzles.txt [solutions.txt]
+    start_time = time.perf_counter()
+    encoder = BatchEncoder(sys.argv[1])
+    solver = BatchSolver(encoder.n)
+    solutions = solver.solve(encoder.values, len(encoder))
+    elapsed_time = time.perf_counter() - start_time
+
+    print(f"{len(encoder)} puzzles: {solver.propagated} solved by propagation, {solver.branched} by branching "
+          f"({solver.rounds} lock-step rounds, {solver.searched} residue searches), "
+          f"{solver.statuses.count('UNSAT')} without solution, {solver.statuses.count('UNKNOWN')} out of time")
+    print(f"Elapsed time: {elapsed_time} seconds")
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w") as f:
+            for solution in solutions:
+                f.write("".join(SYMBOLS[value - 1] for value in solution) + "\n" if solution else "-\n")
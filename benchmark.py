@@ -0,0 +1,227 @@
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from SAT_solver import SATSolver
+from solver_configs import SOLVER_CONFIGS, SOLVERS
+from encoder.batch_encode import BatchEncoder
+from sudoku_rules import generate_rules
+
+# name -> ("dir", directory of full DIMACS puzzles) or ("lines", one puzzle per line on generated rules)
+BENCHMARK_SETS = {
+    "4x4": ("dir", "test_sets/encoded/4x4_sudokus"),
+    "9x9": ("dir", "test_sets/encoded/9x9_sudokus"),
+    "1000": ("lines", "test_sets/unencoded/1000 sudokus.txt"),
+    "16x16": ("dir", "16x16_encoded_concatenated"),
+}
+BASELINE_FILE = "experiment_data/benchmark_baseline.json"
+# summary values compared against the baseline. The search counters, and the puzzles left
+# unsolved by the decision budget, are the same on every machine, so they fail the check.
+# Times, timeouts and memory depend on the machine that wrote the baseline (and vary from
+# run to run), they only warn; regenerate the baseline with --update-baseline before
+# reading anything into them.
+GATED = ("median_decisions", "median_propagations", "median_conflicts", "median_back_tracks", "unsolved")
+WARNED = ("median_time", "p95_time", "max_time", "timeouts", "peak_memory_kb")
+
+
+def puzzle_sources(benchmark_set, limit=None):
+    '''
+    Yields (puzzle name, function building a fresh SATSolver) for every puzzle of a set
+    '''
+    kind, path = BENCHMARK_SETS[benchmark_set]
+    if kind == "dir":
+        names = sorted(f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))[:limit]
+        for name in names:
+            yield name, lambda name=name: SATSolver(os.path.join(path, name))
+    else:
+        encoder = BatchEncoder(path)
+        rule_base = generate_rules(encoder.n)
+        for index in range(len(encoder))[:limit]:
+            name = f"sudoku_{index + 1}"
+            yield name, lambda givens=encoder[index], name=name: SATSolver(name, rule_base=rule_base, givens=givens)
+
+
+def run_benchmark_job(algo, benchmark_set, limit=None, budget=None):
+    '''
+    Runs one solver over one benchmark set, in its own process so the peak memory belongs to this job only
+    '''
+    method, kwargs = SOLVER_CONFIGS.get(algo, (algo, {}))
+    records = {}
+    for name, make_solver in puzzle_sources(benchmark_set, limit):
+        solver = make_solver()
+        solver.set_budget(**(budget or {}))
+
+        start_time = time.perf_counter()
+        getattr(solver, method)(**kwargs)
+        elapsed_time = time.perf_counter() - start_time
+
+        stats = solver.get_stats()
+        records[name] = {"time": elapsed_time, **{key: stats[key] for key in
+                         ("status", "decisions", "propagations", "conflicts", "back_tracks", "max_depth")}}
+        # out of decisions or conflicts is the same everywhere, out of time is not
+        if solver.status == "UNKNOWN":
+            records[name]["timeout"] = not (
+                (solver.max_decisions is not None and solver.decisions >= solver.max_decisions)
+                or (solver.max_conflicts is not None and solver.conflicts >= solver.max_conflicts))
+    # ru_maxrss is in kilobytes on linux
+    return records, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, fraction):
+    '''
+    Nearest-rank percentile of a list of numbers
+    '''
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(records, peak_memory_kb=None):
+    '''
+    Median, p95 and max time plus the median search counters of a {puzzle: record} dict
+    '''
+    records = list(records.values())
+    times = [record["time"] for record in records]
+    summary = {
+        "puzzles": len(records),
+        # records from before the budgets have no status, those runs always finished;
+        # puzzles that ran out of time are counted apart, see WARNED
+        "unsolved": sum(record.get("status", "SAT") not in ("SAT", "UNSAT") and not record.get("timeout")
+                        for record in records),
+        "timeouts": sum(bool(record.get("timeout")) for record in records),
+        "median_time": percentile(times, 0.5),
+        "p95_time": percentile(times, 0.95),
+        "max_time": max(times, default=0),
+    }
+    for counter in ("decisions", "propagations", "conflicts", "back_tracks"):
+        if all(counter in record for record in records):
+            summary[f"median_{counter}"] = percentile([record[counter] for record in records], 0.5)
+    if peak_memory_kb is not None:
+        summary["peak_memory_kb"] = peak_memory_kb
+    return summary
+
+
+def compare(results, baseline, tolerance=1.5, slack=0.005):
+    '''
+    Lists every value that got worse than the baseline by more than the tolerance factor, as
+    (regressions in the GATED counters, warnings for the WARNED times and memory).
+    Times get an absolute slack on top, so timer noise on millisecond puzzles does not count.
+    '''
+    regressions = []
+    warnings = []
+    for algo, sets in results.items():
+        for benchmark_set, summary in sets.items():
+            previous = baseline.get(algo, {}).get(benchmark_set)
+            if previous is None:
+                continue
+            if previous.get("puzzles") != summary["puzzles"]:
+                print(f"baseline for {algo} on {benchmark_set} covers {previous.get('puzzles')} puzzles, "
+                      f"not {summary['puzzles']}... skipping")
+                continue
+            for key in GATED + WARNED:
+                if key not in summary or key not in previous:
+                    continue
+                if key in ("unsolved", "timeouts"):
+                    allowed = previous[key]
+                elif key.endswith("_time"):
+                    allowed = previous[key] * tolerance + slack
+                else:
+                    allowed = previous[key] * tolerance
+                if summary[key] > allowed:
+                    message = f"{algo} on {benchmark_set}: {key} {summary[key]:.4g} (baseline {previous[key]:.4g})"
+                    (regressions if key in GATED else warnings).append(message)
+    return regressions, warnings
+
+
+class Benchmark():
+    """
+    Runs every solver over the benchmark sets and compares the summaries with a stored baseline
+    """
+    def __init__(self, solvers=None, sets=None, limit=None, time_limit=10, workers=1, max_decisions=100000):
+        self.solvers = solvers or SOLVERS
+        self.sets = sets or list(BENCHMARK_SETS)
+        # puzzles per set, None runs all of them
+        self.limit = limit
+        # the decision budget decides what counts as unsolved, the time limit only keeps slow runs short
+        self.budget = {"time_limit": time_limit, "max_decisions": max_decisions}
+        # jobs running side by side compete for the cpu, only use more workers for quick looks
+        self.workers = workers
+        self.results = {}
+
+    def run(self):
+        jobs = [(algo, benchmark_set) for algo in self.solvers for benchmark_set in self.sets]
+        # a fresh process per job keeps the memory peaks apart
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"),
+                                 max_tasks_per_child=1) as executor:
+            futures = {job: executor.submit(run_benchmark_job, *job, self.limit, self.budget) for job in jobs}
+            for (algo, benchmark_set), future in futures.items():
+                records, peak_memory_kb = future.result()
+                summary = summarize(records, peak_memory_kb)
+                self.results.setdefault(algo, {})[benchmark_set] = summary
+                print(f"{algo:<22} {benchmark_set:<6} median {summary['median_time']:.4f}s "
+                      f"p95 {summary['p95_time']:.4f}s max {summary['max_time']:.4f}s "
+                      f"decisions {summary['median_decisions']} propagations {summary['median_propagations']} "
+                      f"conflicts {summary['median_conflicts']} memory {peak_memory_kb} KB "
+                      f"unsolved {summary['unsolved']} timeouts {summary['timeouts']}")
+        return self.results
+
+    def check(self, baseline_file=BASELINE_FILE, tolerance=1.5):
+        '''
+        Raises an exception listing every regression of the search counters against the
+        baseline, slower times or more memory are only printed
+        '''
+        if not os.path.exists(baseline_file):
+            print(f"no baseline at {baseline_file}, nothing to compare against")
+            return
+        with open(baseline_file, "r") as f:
+            baseline = json.load(f)
+        regressions, warnings = compare(self.results, baseline, tolerance)
+        if warnings:
+            print("Slower or bigger than the baseline (machine dependent, not a failure):\n" + "\n".join(warnings))
+        if regressions:
+            raise Exception("Performance regression:\n" + "\n".join(regressions))
+        print("no regressions against the baseline")
+
+    def save_baseline(self, baseline_file=BASELINE_FILE):
+        baseline = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file, "r") as f:
+                baseline = json.load(f)
+        for algo, sets in self.results.items():
+            baseline.setdefault(algo, {}).update(sets)
+        with open(baseline_file, "w") as f:
+            json.dump(baseline, f, indent=4)
+
+
+if __name__ == "__main__":
+    # python benchmark.py [--solvers ...] [--sets ...] [--limit N] [--time-limit S] [--max-decisions N] [--workers N]
+    #                     [--update-baseline]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--solvers", nargs="+")
+    parser.add_argument("--sets", nargs="+", choices=list(BENCHMARK_SETS))
+    parser.add_argument("--limit", type=int, help="number of puzzles per set")
+    parser.add_argument("--time-limit", type=float, default=10, help="budget per puzzle in seconds")
+    parser.add_argument("--max-decisions", type=int, default=100000, help="budget per puzzle in decisions")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.solvers, args.sets, args.limit, args.time_limit, args.workers, args.max_decisions)
+    benchmark.run()
+    if args.update_baseline:
+        benchmark.save_baseline()
+        print(f"baseline written to {BASELINE_FILE}")
+    else:
+        try:
+            benchmark.check(tolerance=args.tolerance)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
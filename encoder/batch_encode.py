@@ -0,0 +1,120 @@
+import os
+import sys
+from array import array
+from itertools import accumulate, compress
+from operator import add
+
+# cell symbols in value order: 1-9, then letters for 10 and up (A = 10, ..., G = 16 as in encode16x16.py)
+SYMBOLS = "123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# symbols for an empty cell
+EMPTY = ".0_"
+
+
+def variable_base(n):
+    '''
+    Base of the rcv variable numbering: the decimal r c v digits up to 9x9, n + 1 above that
+    '''
+    return 10 if n < 10 else n + 1
+
+
+class BatchEncoder():
+    '''
+    Encodes every puzzle of a text file (one puzzle per line) in one bulk pass.
+    The symbols of all puzzles are translated to cell values with bytes.translate, and
+    the givens fall out of itertools.compress over a table of per-cell variable codes,
+    since the code of value v in a cell is cell_code + v. No per-character python loop.
+    '''
+    def __init__(self, input_file, n=None, symbols=SYMBOLS, lines=None):
+        # puzzles can also be passed in as lines (bytes), input_file then only names them
+        if lines is None:
+            with open(input_file, "rb") as f:
+                lines = f.read().split()
+        if not lines:
+            raise Exception(f"Error, no puzzles in {input_file}!")
+
+        # the dimension follows from the length of a line unless it is given
+        self.n = n or round(len(lines[0]) ** 0.5)
+        n = self.n
+        cells = n * n
+        if any(len(line) != cells for line in lines):
+            raise Exception(f"Error, every puzzle in {input_file} needs {cells} cells!")
+        self.input_file = input_file
+        self.num_puzzles = len(lines)
+
+        # symbol -> value byte, 0 for an empty cell and 255 for anything that is not a symbol
+        table = bytearray([255]) * 256
+        for symbol in EMPTY:
+            table[ord(symbol)] = 0
+        for value, symbol in enumerate(symbols[:n], start=1):
+            table[ord(symbol)] = value
+            table[ord(symbol.lower())] = value
+        values = b"".join(lines).translate(table)
+        if 255 in values:
+            raise Exception(f"Error, unknown symbol in {input_file}!")
+        # cell values of every puzzle, row-major and puzzle after puzzle, 0 for an empty cell
+        self.values = values
+
+        base = variable_base(n)
+        cell_codes = array('i', [base * base * (i // n + 1) + base * (i % n + 1) for i in range(cells)])
+
+        # literals of puzzle k are givens[offsets[k]:offsets[k + 1]]
+        self.givens = array('i', map(add, compress(cell_codes * self.num_puzzles, values), compress(values, values)))
+        self.offsets = array('i', accumulate((cells - values.count(0, k * cells, (k + 1) * cells)
+                                              for k in range(self.num_puzzles)), initial=0))
+
+    def __len__(self):
+        return self.num_puzzles
+
+    def __getitem__(self, index):
+        '''
+        The givens of one puzzle as a list of DIMACS literals
+        '''
+        return self.givens[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def __iter__(self):
+        for index in range(self.num_puzzles):
+            yield self[index]
+
+    def rules_file(self):
+        return f"rules/sudoku-rules-{self.n}x{self.n}.txt"
+
+    def solvers(self, rules_file=None):
+        '''
+        Yields a SATSolver per puzzle on one shared rule base, without writing any files.
+        Without a rules file the rules are generated in memory (see sudoku_rules.py).
+        '''
+        from SAT_solver import SATSolver, load_rule_base
+        from sudoku_rules import generate_rules
+
+        rule_base = load_rule_base(rules_file) if rules_file else generate_rules(self.n)
+        name = os.path.splitext(os.path.basename(self.input_file))[0].replace(" ", "_")
+        for index, givens in enumerate(self):
+            yield SATSolver(f"{name}_sudoku_{index + 1}.txt", rule_base=rule_base, givens=givens)
+
+    def write_files(self, output_folder, rules_file=None):
+        '''
+        Writes one DIMACS file per puzzle with the givens as unit clauses, followed by
+        the rules (without their header) when a rules file is given
+        '''
+        os.makedirs(output_folder, exist_ok=True)
+        rules = b""
+        if rules_file is not None:
+            with open(rules_file, "rb") as f:
+                rules = b"".join(line for line in f if not line.lstrip().startswith(b"p"))
+        name = os.path.splitext(os.path.basename(self.input_file))[0].replace(" ", "_")
+
+        for index, givens in enumerate(self):
+            with open(os.path.join(output_folder, f"{name}_sudoku_{index + 1}.txt"), "wb") as f:
+                f.write("".join(f"{literal} 0\n" for literal in givens).encode())
+                f.write(rules)
+
+
+if __name__ == "__main__":
+    # python encoder/batch_encode.py puzzles.txt output_folder [rules_file]
+    input_file = sys.argv[1]
+    output_folder = sys.argv[2]
+    rules_file = sys.argv[3] if len(sys.argv) > 3 else None
+
+    encoder = BatchEncoder(input_file)
+    encoder.write_files(output_folder, rules_file)
+    print(f"encoded {len(encoder)} {encoder.n}x{encoder.n} puzzles into {output_folder}")
@@ -0,0 +1,122 @@
+import multiprocessing
+import sys
+import time
+from multiprocessing import connection
+
+from SAT_solver import SATSolver
+
+# the strategies from experiment_data/1000_sudokus.json, each of them wins on some puzzles
+DEFAULT_STRATEGIES = ("solve_heuristic_2", "solve_heuristic_1", "solve_dpll", "solve_vsids")
+
+
+def run_strategy(solver, strategy, results):
+    '''
+    Process entry point: runs one strategy on its own copy of the solver and reports back
+    through its end of a pipe, a strategy that fails reports status "ERROR" and the message
+    '''
+    try:
+        getattr(solver, strategy)()
+        result = (strategy, solver.status, solver.solution, solver.back_tracks, solver.restarts,
+                  solver.clause_db_bytes())
+    except Exception as e:
+        result = (strategy, "ERROR", str(e), 0, 0, None)
+    results.send(result)
+    results.close()
+
+
+class PortfolioSolver():
+    '''
+    Races several solver strategies on the same instance in separate processes.
+    The first definite answer (SAT or UNSAT) wins and the remaining processes are terminated,
+    a strategy that runs out of budget, fails or dies just drops out of the race.
+    '''
+    def __init__(self, input_file, strategies=DEFAULT_STRATEGIES, budget=None):
+        # the instance is parsed once, the processes get it through fork (or a pickle);
+        # an already loaded SATSolver can be passed instead of a file
+        self.solver = input_file if isinstance(input_file, SATSolver) else SATSolver(input_file)
+        self.solver.set_budget(**(budget or {}))
+        for strategy in strategies:
+            if not strategy.startswith("solve") or not hasattr(SATSolver, strategy):
+                raise Exception(f"Error, unknown strategy {strategy}!")
+        self.strategies = list(strategies)
+        self.winner = None
+        # clause database size of the winning strategy
+        self.clause_db_bytes = None
+
+    def solve(self):
+        # one pipe per strategy, so a process that dies is noticed through its sentinel
+        # instead of leaving the parent waiting for a result that never comes
+        running = {}
+        for strategy in self.strategies:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_strategy, args=(self.solver, strategy, sender), daemon=True)
+            process.start()
+            sender.close()
+            running[process.sentinel] = (strategy, process, receiver)
+        processes = [process for _, process, _ in running.values()]
+
+        self.winner = None
+        self.solver.status = "UNKNOWN"
+        self.solver.solution = {}
+        time_limit = self.solver.time_limit
+        deadline = time.monotonic() + time_limit if time_limit is not None else None
+        try:
+            while running and self.winner is None:
+                timeout = max(0, deadline - time.monotonic()) if deadline is not None else None
+                ready = connection.wait([receiver for _, _, receiver in running.values()] + list(running), timeout)
+                if not ready:
+                    break
+                for sentinel, (strategy, process, receiver) in list(running.items()):
+                    if sentinel not in ready and receiver not in ready:
+                        continue
+                    del running[sentinel]
+                    try:
+                        result = receiver.recv()
+                    except EOFError:
+                        # the process exited without a result (killed, out of memory, ...)
+                        process.join()
+                        print(f"{strategy} died with exit code {process.exitcode}")
+                        continue
+                    finally:
+                        receiver.close()
+                    _, status, solution, back_tracks, restarts, clause_db_bytes = result
+                    if status == "ERROR":
+                        print(f"{strategy} failed: {solution}")
+                        continue
+                    if status == "UNKNOWN":
+                        continue
+                    self.winner = strategy
+                    self.solver.status = status
+                    self.solver.solution = solution
+                    self.solver.back_tracks = back_tracks
+                    self.solver.restarts = restarts
+                    self.clause_db_bytes = clause_db_bytes
+                    break
+        finally:
+            # cancel the strategies that are still running
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            for _, _, receiver in running.values():
+                receiver.close()
+
+        if self.winner is None:
+            print("No strategy finished within the budget")
+        else:
+            print(f"{self.winner} answered first: {self.solver.status}")
+        return self.solver.status == "SAT"
+
+
+if __name__ == "__main__":
+    # python portfolio.py input_file [strategy ...]
+    input_file = sys.argv[1]
+    strategies = sys.argv[2:] or DEFAULT_STRATEGIES
+
+    start_time = time.time()
+    portfolio = PortfolioSolver(input_file, strategies)
+    if portfolio.solve():
+        portfolio.solver.write_output()
+        portfolio.solver.verify_model()
+    print(f"Elapsed time: {time.time() - start_time} seconds")
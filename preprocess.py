@@ -0,0 +1,269 @@
+from collections import defaultdict
+import sys
+import time
+
+
+class CNFPreprocessor():
+    """
+    Simplifies a CNF formula before search: unit propagation, failed literal probing,
+    subsumption, self-subsuming strengthening and bounded variable elimination.
+    Works on plain lists of signed int clauses, so it can be used on any DIMACS file.
+    Eliminated variables are recorded so extend_model can complete a model of the
+    simplified formula into a model of the original one.
+    """
+    def __init__(self, clauses, frozen=(), probe_limit=100000, elim_occurrence_limit=16, elim_clause_limit=12):
+        # clause id -> set of literals, literal -> ids of the clauses it occurs in
+        self.clauses = {}
+        self.next_cid = 0
+        self.occurs = defaultdict(set)
+        self.units = []
+        self.fixed = {}
+        self.unsat = False
+        # variables that must keep their meaning (e.g. assumptions) are never eliminated
+        self.frozen = {abs(literal) for literal in frozen}
+        self.probe_limit = probe_limit
+        self.elim_occurrence_limit = elim_occurrence_limit
+        self.elim_clause_limit = elim_clause_limit
+        # (witness literal, clause) pairs of eliminated variables, in elimination order
+        self.elimination_stack = []
+        self.stats = {"units": 0, "failed_literals": 0, "subsumed": 0, "strengthened": 0, "eliminated_vars": 0}
+
+        for clause in clauses:
+            clause = set(clause)
+            if any(-literal in clause for literal in clause):
+                continue
+            self.add_clause(clause)
+
+    def add_clause(self, clause):
+        if len(clause) == 0:
+            self.unsat = True
+            return None
+        if len(clause) == 1:
+            (literal,) = clause
+            self.units.append(literal)
+        cid = self.next_cid
+        self.next_cid += 1
+        self.clauses[cid] = clause
+        for literal in clause:
+            self.occurs[literal].add(cid)
+        return cid
+
+    def remove_clause(self, cid):
+        for literal in self.clauses.pop(cid):
+            self.occurs[literal].discard(cid)
+
+    def remove_literal(self, cid, literal):
+        clause = self.clauses[cid]
+        clause.discard(literal)
+        self.occurs[literal].discard(cid)
+        if len(clause) == 0:
+            self.unsat = True
+        elif len(clause) == 1:
+            self.units.append(next(iter(clause)))
+
+    def propagate_units(self):
+        '''
+        Applies every pending unit: satisfied clauses go, the negated literal is
+        removed from the rest. Returns False once the formula is unsatisfiable.
+        '''
+        while self.units and not self.unsat:
+            literal = self.units.pop()
+            known = self.fixed.get(abs(literal))
+            if known is not None:
+                if known != (literal > 0):
+                    self.unsat = True
+                continue
+            self.fixed[abs(literal)] = literal > 0
+            self.stats["units"] += 1
+            for cid in list(self.occurs[literal]):
+                self.remove_clause(cid)
+            for cid in list(self.occurs[-literal]):
+                self.remove_literal(cid, -literal)
+        return not self.unsat
+
+    def implied_literals(self, literal, budget):
+        '''
+        Unit propagation of a single assumed literal without touching the formula.
+        Returns the implied literals, or None if the assumption leads to a conflict.
+        budget is a one element list holding the remaining number of clause visits.
+        '''
+        true = {literal}
+        queue = [literal]
+        while queue:
+            current = queue.pop()
+            for cid in self.occurs[-current]:
+                budget[0] -= 1
+                unassigned = None
+                satisfied = False
+                open_literals = 0
+                for other in self.clauses[cid]:
+                    if other in true:
+                        satisfied = True
+                        break
+                    if -other not in true:
+                        open_literals += 1
+                        unassigned = other
+                if satisfied:
+                    continue
+                if open_literals == 0:
+                    return None
+                if open_literals == 1:
+                    true.add(unassigned)
+                    queue.append(unassigned)
+        return true
+
+    def probe(self):
+        '''
+        Failed literal probing: a literal whose assumption propagates into a conflict
+        is false. Only variables in binary clauses are probed, within probe_limit clause visits.
+        '''
+        budget = [self.probe_limit]
+        candidates = {abs(literal) for clause in self.clauses.values() if len(clause) == 2 for literal in clause}
+        for var in sorted(candidates):
+            if budget[0] <= 0 or self.unsat:
+                break
+            for literal in (var, -var):
+                if var in self.fixed:
+                    break
+                if self.implied_literals(literal, budget) is None:
+                    self.stats["failed_literals"] += 1
+                    self.units.append(-literal)
+                    if not self.propagate_units():
+                        return False
+        return not self.unsat
+
+    def subsume(self):
+        '''
+        Removes clauses subsumed by a smaller clause, and strengthens clauses D with
+        C = (l or R), D = (-l or R or S) to (R or S) (self-subsuming resolution)
+        '''
+        for cid in sorted(self.clauses, key=lambda cid: len(self.clauses[cid])):
+            clause = self.clauses.get(cid)
+            if clause is None:
+                continue
+            size = len(clause)
+
+            # subsumption: all candidates contain the rarest literal of the clause
+            rarest = min(clause, key=lambda literal: len(self.occurs[literal]))
+            for other in list(self.occurs[rarest]):
+                if other != cid and len(self.clauses[other]) >= size and clause <= self.clauses[other]:
+                    self.remove_clause(other)
+                    self.stats["subsumed"] += 1
+
+            # self-subsuming resolution on every literal of the clause
+            for literal in list(clause):
+                rest = clause - {literal}
+                for other in list(self.occurs[-literal]):
+                    if other == cid or len(self.clauses[other]) < size:
+                        continue
+                    if rest <= self.clauses[other]:
+                        self.remove_literal(other, -literal)
+                        self.stats["strengthened"] += 1
+
+            if not self.propagate_units():
+                return False
+        return True
+
+    def eliminate(self):
+        '''
+        Bounded variable elimination: a variable is replaced by all non-tautological
+        resolvents of its clauses when that does not increase the number of clauses
+        '''
+        variables = {abs(literal) for literal, cids in self.occurs.items() if cids}
+        for var in sorted(variables, key=lambda var: len(self.occurs[var]) + len(self.occurs[-var])):
+            if var in self.frozen or var in self.fixed or self.unsat:
+                continue
+            positive = list(self.occurs[var])
+            negative = list(self.occurs[-var])
+            if len(positive) + len(negative) == 0 or len(positive) + len(negative) > self.elim_occurrence_limit:
+                continue
+
+            resolvents = []
+            too_many = False
+            for p in positive:
+                for n in negative:
+                    resolvent = (self.clauses[p] | self.clauses[n]) - {var, -var}
+                    if any(-literal in resolvent for literal in resolvent):
+                        continue
+                    if len(resolvent) > self.elim_clause_limit or len(resolvents) >= len(positive) + len(negative):
+                        too_many = True
+                        break
+                    resolvents.append(resolvent)
+                if too_many:
+                    break
+            if too_many:
+                continue
+
+            for cid in positive:
+                self.elimination_stack.append((var, frozenset(self.clauses[cid])))
+                self.remove_clause(cid)
+            for cid in negative:
+                self.elimination_stack.append((-var, frozenset(self.clauses[cid])))
+                self.remove_clause(cid)
+            for resolvent in resolvents:
+                self.add_clause(resolvent)
+            self.stats["eliminated_vars"] += 1
+
+            if not self.propagate_units():
+                return False
+        return True
+
+    def run(self, probe=True, subsume=True, eliminate=True):
+        '''
+        Runs the enabled passes. Returns False if the formula was found unsatisfiable.
+        '''
+        if not self.propagate_units():
+            return False
+        if probe and not self.probe():
+            return False
+        if subsume and not self.subsume():
+            return False
+        if eliminate and not self.eliminate():
+            return False
+        return not self.unsat
+
+    def simplified_clauses(self):
+        '''
+        Returns the simplified formula, fixed variables included as unit clauses
+        '''
+        if self.unsat:
+            return [()]
+        clauses = [(var if value else -var,) for var, value in self.fixed.items()]
+        clauses.extend(tuple(sorted(clause, key=abs)) for clause in self.clauses.values())
+        return clauses
+
+    def extend_model(self, model):
+        '''
+        Completes a model (var -> bool) of the simplified formula into a model of the
+        original one by walking the eliminated clauses backwards
+        '''
+        for var, value in self.fixed.items():
+            model[var] = value
+        for witness, clause in reversed(self.elimination_stack):
+            if not any(model.get(abs(literal), False) == (literal > 0) for literal in clause):
+                model[abs(witness)] = witness > 0
+        return model
+
+
+if __name__ == "__main__":
+    # python preprocess.py input.cnf output.cnf
+    from SAT_solver import SATSolver
+
+    input_file = sys.argv[1]
+    output_file = sys.argv[2]
+
+    start_time = time.time()
+    clauses = SATSolver.parse_dimacs(input_file)
+    preprocessor = CNFPreprocessor(clauses)
+    preprocessor.run()
+    simplified = preprocessor.simplified_clauses()
+
+    max_var = max((abs(literal) for clause in clauses for literal in clause), default=0)
+    with open(output_file, "w") as f:
+        f.write(f"p cnf {max_var} {len(simplified)}\n")
+        for clause in simplified:
+            f.write(" ".join(map(str, clause)) + " 0\n")
+
+    print(f"{len(clauses)} clauses -> {len(simplified)} clauses")
+    print(preprocessor.stats)
+    print(f"Elapsed time: {time.time() - start_time} seconds")
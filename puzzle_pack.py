@@ -0,0 +1,162 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from SAT_solver import SATSolver, RuleBase, load_rule_base
+from encoder.batch_encode import BatchEncoder
+from sudoku_rules import generate_rules
+
+MAGIC = b"SATPACK1"
+# n, puzzles, rule variables, rule literals, rule offsets, givens
+HEADER = struct.Struct("=8s6i")
+
+# packs opened in this process, keyed by (path, modification time, size)
+pack_cache = {}
+
+
+def write_pack(pack_file, rule_base, puzzles):
+    '''
+    Writes a puzzle pack: the rule base once (in its internal numbering, so loading it needs
+    no parsing) followed by the givens (DIMACS literals) of every puzzle.
+    All numbers are native int32: header, var_names, rule literals, rule offsets,
+    puzzle offsets and givens, so every section can be memory-mapped as it is.
+    '''
+    givens = array('i')
+    offsets = array('i', [0])
+    for puzzle in puzzles:
+        givens.extend(puzzle)
+        offsets.append(len(givens))
+
+    var_names = array('i', rule_base.var_names)
+    # sudoku rules have n * n * n variables
+    n = round((len(var_names) - 1) ** (1 / 3))
+    rule_lits = array('i', rule_base.clause_lits)
+    rule_offsets = array('i', rule_base.clause_offsets)
+    with open(pack_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, n, len(offsets) - 1, len(var_names), len(rule_lits), len(rule_offsets), len(givens)))
+        for section in (var_names, rule_lits, rule_offsets, offsets, givens):
+            section.tofile(f)
+
+
+class PuzzlePack():
+    """
+    Read side of a puzzle pack. The file is memory-mapped and the givens of any puzzle are
+    sliced straight out of the mapping, so opening a pack with thousands of puzzles costs
+    next to nothing and puzzles can be visited in any order.
+    """
+    def __init__(self, pack_file):
+        self.pack_file = pack_file
+        self.name = os.path.splitext(os.path.basename(pack_file))[0]
+        with open(pack_file, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.n, self.num_puzzles, num_vars, num_lits, num_offsets, num_givens = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise Exception(f"Error, {pack_file} is not a puzzle pack!")
+
+        self.numbers = memoryview(self.map)[HEADER.size:].cast('i')
+        self.sections = []
+        start = 0
+        for length in (num_vars, num_lits, num_offsets, self.num_puzzles + 1, num_givens):
+            self.sections.append(self.numbers[start:start + length])
+            start += length
+        self.var_names, self.rule_lits, self.rule_offsets, self.offsets, self.givens = self.sections
+        self.rules = None
+
+    def __len__(self):
+        return self.num_puzzles
+
+    def __getitem__(self, index):
+        '''
+        The givens of one puzzle as a list of DIMACS literals
+        '''
+        return self.givens[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def __iter__(self):
+        for index in range(self.num_puzzles):
+            yield self[index]
+
+    def puzzle_name(self, index):
+        return f"{self.name}_sudoku_{index + 1}.txt"
+
+    def rule_base(self):
+        if self.rules is None:
+            self.rules = RuleBase(self.var_names, array('i', self.rule_lits), array('i', self.rule_offsets),
+                                  file_hash=self.name)
+        return self.rules
+
+    def solver(self, index):
+        '''
+        A SATSolver for one puzzle on the rule base shared by the whole pack
+        '''
+        return SATSolver(self.puzzle_name(index), rule_base=self.rule_base(), givens=self[index])
+
+    def export(self, output_folder):
+        '''
+        Writes every puzzle as a complete DIMACS file (rules plus givens as unit clauses)
+        '''
+        os.makedirs(output_folder, exist_ok=True)
+        rules = "".join(" ".join(map(str, clause)) + " 0\n" for clause in self.rule_base().iter_dimacs())
+        num_vars = max(self.var_names, default=0)
+        num_rules = len(self.rule_offsets) - 1
+        for index, givens in enumerate(self):
+            with open(os.path.join(output_folder, self.puzzle_name(index)), "w") as f:
+                f.write(f"p cnf {max([num_vars, *map(abs, givens)])} {num_rules + len(givens)}\n")
+                f.write("".join(f"{literal} 0\n" for literal in givens))
+                f.write(rules)
+
+    def close(self):
+        # the mapping can only be closed once no view points into it any more
+        for section in self.sections:
+            section.release()
+        self.numbers.release()
+        self.map.close()
+
+
+def open_pack(pack_file):
+    '''
+    Returns the opened pack for a file, opening it at most once per process
+    '''
+    stat = os.stat(pack_file)
+    key = (os.path.realpath(pack_file), stat.st_mtime_ns, stat.st_size)
+    if key not in pack_cache:
+        pack_cache[key] = PuzzlePack(pack_file)
+    return pack_cache[key]
+
+
+def pack_folder(folder, rules_file):
+    '''
+    Givens of every encoded puzzle file in a folder (its unit clauses that are not rules), in name order
+    '''
+    rule_units = {clause[0] for clause in load_rule_base(rules_file).iter_dimacs() if len(clause) == 1}
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            yield [clause[0] for clause in SATSolver.parse_dimacs(path)
+                   if len(clause) == 1 and clause[0] not in rule_units]
+
+
+if __name__ == "__main__":
+    # python puzzle_pack.py pack puzzles.txt output.pack [rules_file]  (generated rules by default)
+    # python puzzle_pack.py pack encoded_folder output.pack rules_file
+    # python puzzle_pack.py export input.pack output_folder
+    command = sys.argv[1]
+    if command == "pack":
+        source, pack_file = sys.argv[2], sys.argv[3]
+        if os.path.isdir(source):
+            rules_file = sys.argv[4]
+            puzzles = pack_folder(source, rules_file)
+        else:
+            encoder = BatchEncoder(source)
+            rules_file = sys.argv[4] if len(sys.argv) > 4 else None
+            puzzles = iter(encoder)
+        write_pack(pack_file, load_rule_base(rules_file) if rules_file else generate_rules(encoder.n), puzzles)
+        print(f"{len(PuzzlePack(pack_file))} puzzles packed into {pack_file}")
+    elif command == "export":
+        pack = PuzzlePack(sys.argv[2])
+        pack.export(sys.argv[3])
+        print(f"{len(pack)} puzzles exported to {sys.argv[3]}")
+    else:
+        raise Exception(f"Error, unknown command {command}!")
@@ -0,0 +1,340 @@
+import hashlib
+import math
+import shelve
+import sys
+from array import array
+from collections import OrderedDict
+from itertools import chain, groupby, permutations, product
+from operator import itemgetter
+
+from encoder.batch_encode import variable_base
+from sudoku_rules import generate_rules
+
+# n -> rule_digest of the sudoku rules of generate_rules(n)
+standard_rule_digests = {}
+
+
+def decode_givens(givens, n):
+    '''
+    Grid of an n x n sudoku (row-major cell values, 0 for empty) from its givens as DIMACS
+    literals, or None if the literals are not sudoku variables of the rcv scheme. A negative
+    literal is only allowed when the positive givens already imply it, anything else is a
+    constraint the grid cannot express.
+    '''
+    base = variable_base(n)
+    box = math.isqrt(n)
+    grid = [0] * (n * n)
+    excluded = []
+    for literal in givens:
+        r, c, v = abs(literal) // (base * base) - 1, abs(literal) // base % base - 1, abs(literal) % base - 1
+        if not (0 <= r < n and 0 <= c < n and 0 <= v < n):
+            return None
+        if literal < 0:
+            excluded.append((r, c, v + 1))
+            continue
+        if grid[r * n + c] not in (0, v + 1):
+            return None
+        grid[r * n + c] = v + 1
+
+    for r, c, value in excluded:
+        if grid[r * n + c] == value:
+            return None
+        if grid[r * n + c]:
+            continue
+        # implied by the same value in the row, the column or the box
+        r0, c0 = r - r % box, c - c % box
+        unit = chain(grid[r * n:r * n + n], grid[c::n],
+                     (grid[i * n + j] for i in range(r0, r0 + box) for j in range(c0, c0 + box)))
+        if value not in unit:
+            return None
+    return grid
+
+
+def rule_digest(clauses):
+    '''
+    Digest of the set of clauses (tuples of DIMACS literals) longer than a unit, independent
+    of their order, of repeats and of the order of the literals in each
+    '''
+    digest = hashlib.sha256()
+    for clause in sorted({tuple(sorted(set(clause))) for clause in clauses if len(clause) > 1}):
+        digest.update(array('i', clause + (0,)).tobytes())
+    return digest.digest()
+
+
+def rules_key(solver, n):
+    '''
+    Cache key prefix for the clauses of a solver other than its givens: empty for the sudoku
+    rules of generate_rules(n), else their rule_digest, so puzzles under different rules
+    never share an entry
+    '''
+    rules = generate_rules(n)
+    offsets = solver.clause_offsets
+    # built on the generated rules with nothing but units loaded after them
+    if (solver.rule_base is rules and solver.original_clause_lits is None
+            and all(offsets[i + 1] - offsets[i] == 1 for i in range(len(rules.clause_offsets) - 1, len(offsets) - 1))):
+        return b""
+    digest = rule_digest(tuple(map(solver.to_dimacs, clause)) for clause in solver.iter_clauses())
+    if n not in standard_rule_digests:
+        standard_rule_digests[n] = rule_digest(rules.iter_dimacs())
+    return b"" if digest == standard_rule_digests[n] else digest
+
+
+def encode_grid(grid, n):
+    '''
+    The true DIMACS literals of a filled grid
+    '''
+    base = variable_base(n)
+    return [base * base * (i // n + 1) + base * (i % n + 1) + value for i, value in enumerate(grid)]
+
+
+def line_ties(grid, n, transposed):
+    '''
+    Sorts the bands and the rows within each band (the columns when transposed) by an invariant
+    signature: the number of givens of a line, plus the given counts of the crossing lines it
+    meets. Returns the runs of bands with equal signatures, and per band its runs of lines.
+    Only lines (or bands) within a run are permuted, any sudoku symmetry maps the resulting
+    set of orders onto the other puzzle's set.
+    '''
+    box = math.isqrt(n)
+
+    def cell(line, i):
+        return grid[i * n + line] if transposed else grid[line * n + i]
+
+    counts = [sum(map(bool, (cell(line, i) for i in range(n)))) for line in range(n)]
+    crossing = [sum(bool(cell(line, i)) for line in range(n)) for i in range(n)]
+    signatures = [(counts[line], sorted(crossing[i] for i in range(n) if cell(line, i)))
+                  for line in range(n)]
+
+    def runs(items, key):
+        # items sorted by key (largest first), split into runs of equal keys
+        return [list(run) for _, run in groupby(sorted(items, key=key, reverse=True), key=key)]
+
+    line_runs = {band: runs(range(band * box, band * box + box), signatures.__getitem__) for band in range(box)}
+    band_signature = {band: sorted(signatures[line] for line in range(band * box, band * box + box))
+                      for band in range(box)}
+    return runs(range(box), band_signature.__getitem__), line_runs
+
+
+def count_orders(ties):
+    '''
+    Number of line orders line_orders builds out of line_ties, without building them
+    '''
+    band_runs, line_runs = ties
+    return math.prod(math.factorial(len(run)) for run in chain(band_runs, *line_runs.values()))
+
+
+def line_orders(ties):
+    '''
+    Every line order out of line_ties: the bands and lines within each run in every permutation
+    '''
+    band_runs, line_runs = ties
+
+    def tied_orders(runs):
+        return [list(chain.from_iterable(choice)) for choice in product(*map(permutations, runs))]
+
+    line_options = {band: tied_orders(runs) for band, runs in line_runs.items()}
+    return [list(chain.from_iterable(choice)) for bands in tied_orders(band_runs)
+            for choice in product(*(line_options[band] for band in bands))]
+
+
+def canonical_form(grid, n, max_candidates=20000):
+    '''
+    Canonical form of a sudoku under the symmetries that keep it a sudoku: relabeling the
+    digits, transposition, swapping bands or stacks and swapping rows or columns within them.
+    Among the orders of line_orders, the smallest grid wins after its digits are relabeled
+    1, 2, ... in order of first appearance. Returns (canonical grid bytes, positions, labels):
+    canonical cell k is input cell positions[k] and input digit d became labels[d].
+    Returns None when the puzzle is too symmetric to try every candidate order, which is
+    known from the sizes of the ties before any order is built.
+    '''
+    box = math.isqrt(n)
+    if box * box != n:
+        return None
+
+    ties = {transposed: line_ties(grid, n, transposed) for transposed in (False, True)}
+    # the rows of one orientation are the columns of the other
+    if 2 * count_orders(ties[False]) * count_orders(ties[True]) > max_candidates:
+        return None
+    orientations = [(transposed, line_orders(ties[transposed]), line_orders(ties[not transposed]))
+                    for transposed in (False, True)]
+
+    best = None
+    for transposed, rows, columns in orientations:
+        for row_order in rows:
+            for column_order in columns:
+                if transposed:
+                    positions = [c * n + r for r in row_order for c in column_order]
+                else:
+                    positions = [r * n + c for r in row_order for c in column_order]
+                cells = itemgetter(*positions)(grid)
+                # digits in order of first appearance get the labels 1, 2, ...
+                labels = [0] * (n + 1)
+                for label, digit in enumerate((d for d in dict.fromkeys(cells) if d), start=1):
+                    labels[digit] = label
+                key = bytes(map(labels.__getitem__, cells))
+                if best is None or key < best[0]:
+                    best = (key, positions, labels)
+    return best
+
+
+def full_labels(labels, n):
+    '''
+    Extends a label table to every digit: digits without a given take the next labels in
+    ascending order, any choice is fine since those digits are interchangeable in the puzzle
+    '''
+    labels = list(labels)
+    next_label = max(labels) + 1
+    for digit in range(1, n + 1):
+        if not labels[digit]:
+            labels[digit] = next_label
+            next_label += 1
+    return labels
+
+
+class SolutionCache():
+    """
+    LRU cache of sudoku solutions keyed by the canonical form of the givens, so a puzzle
+    that only differs from a solved one by a sudoku symmetry is answered without a search.
+    The most recent entries live in memory, the rest spill to a shelve file (when one is
+    given) that also keeps them between runs. Canonical forms of recently seen givens are
+    remembered as well, so an exact repeat skips the canonicalization too.
+    Puzzles under rules other than the plain sudoku rules are keyed with their rules_key.
+    """
+    def __init__(self, cache_file=None, capacity=10000):
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        # (n, sorted givens) -> canonical_form result
+        self.forms = OrderedDict()
+        self.shelf = shelve.open(cache_file) if cache_file else None
+        self.hits = 0
+        self.misses = 0
+
+    def canonicalize(self, givens, n):
+        key = (n, tuple(sorted(givens)))
+        if key in self.forms:
+            self.forms.move_to_end(key)
+            return self.forms[key]
+        grid = decode_givens(givens, n)
+        form = canonical_form(grid, n) if grid is not None else None
+        self.forms[key] = form
+        if len(self.forms) > self.capacity:
+            self.forms.popitem(last=False)
+        return form
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if self.shelf is not None and key.hex() in self.shelf:
+            solution = self.shelf[key.hex()]
+            self.put(key, solution)
+            return solution
+        return None
+
+    def put(self, key, solution):
+        self.memory[key] = solution
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            old_key, old_solution = self.memory.popitem(last=False)
+            if self.shelf is not None:
+                self.shelf[old_key.hex()] = old_solution
+
+    def lookup(self, givens, n, rules=b""):
+        '''
+        The true DIMACS literals of a cached solution for the givens, mapped back through
+        the symmetry from the canonical form, or None
+        '''
+        return self.lookup_form(self.canonicalize(givens, n), n, rules)
+
+    def lookup_form(self, form, n, rules=b""):
+        '''
+        lookup for givens already canonicalized (by canonical_form, None when it gave up)
+        '''
+        solution = self.get(rules + form[0]) if form is not None else None
+        if solution is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        _, positions, labels = form
+        digits = [0] * (n + 1)
+        for digit, label in enumerate(full_labels(labels, n)):
+            digits[label] = digit
+        grid = [0] * (n * n)
+        for position, label in zip(positions, solution):
+            grid[position] = digits[label]
+        return encode_grid(grid, n)
+
+    def store(self, givens, n, literals, rules=b""):
+        '''
+        Caches the solution (its true DIMACS literals) of the givens under their canonical form
+        '''
+        self.store_form(self.canonicalize(givens, n), n, literals, rules)
+
+    def store_form(self, form, n, literals, rules=b""):
+        '''
+        store for givens already canonicalized
+        '''
+        grid = decode_givens(literals, n)
+        if form is None or grid is None or not all(grid):
+            return
+        key, positions, labels = form
+        labels = full_labels(labels, n)
+        self.put(rules + key, bytes(labels[grid[position]] for position in positions))
+
+    @staticmethod
+    def solver_puzzle(solver):
+        '''
+        (givens, n, rules_key) of a sudoku SATSolver, or None when its variables are not a sudoku's
+        '''
+        n = solver.puzzle_dimension
+        if len(solver.var_names) - 1 != n ** 3:
+            return None
+        givens = solver.givens
+        if givens is None:
+            givens = [solver.to_dimacs(clause[0]) for clause in solver.iter_clauses() if len(clause) == 1]
+        return givens, n, rules_key(solver, n)
+
+    def fetch(self, solver):
+        '''
+        Fills in solver.solution from the cache, returns whether it did. The model is checked
+        against the solver's clauses first, a cached solution that does not fit is not used.
+        '''
+        puzzle = self.solver_puzzle(solver)
+        literals = self.lookup(*puzzle) if puzzle is not None else None
+        if literals is None:
+            return False
+        true_vars = {solver.var_ids[name] for name in literals}
+        model = {var: var in true_vars for var in range(1, len(solver.var_names))}
+        if not solver.verify_model(model, quiet=True):
+            self.hits -= 1
+            self.misses += 1
+            return False
+        solver.solution = model
+        solver.status = "SAT"
+        return True
+
+    def remember(self, solver):
+        '''
+        Caches the solution of a solved SATSolver
+        '''
+        puzzle = self.solver_puzzle(solver)
+        if puzzle is None or solver.status != "SAT" or not solver.solution:
+            return
+        givens, n, rules = puzzle
+        self.store(givens, n, [solver.var_names[var] for var, value in solver.solution.items() if value], rules)
+
+    def close(self):
+        # everything still in memory goes to disk so the next run finds it
+        if self.shelf is not None:
+            for key, solution in self.memory.items():
+                self.shelf[key.hex()] = solution
+            self.shelf.close()
+            self.shelf = None
+
+
+if __name__ == "__main__":
+    # python solution_cache.py cache_file: entries and size of a cache file
+    with shelve.open(sys.argv[1], flag="r") as shelf:
+        sizes = [len(shelf[key]) for key in shelf]
+        print(f"{len(sizes)} cached solutions ({sum(sizes)} bytes of grids)")
@@ -0,0 +1,13 @@
+# names for solver methods run with non-default arguments: name -> (method, keyword arguments)
+SOLVER_CONFIGS = {
+    "solve_vsids_luby": ("solve_vsids", {"restarts": "luby"}),
+    "solve_vsids_geometric": ("solve_vsids", {"restarts": "geometric"}),
+    "solve_vsids_glucose": ("solve_vsids", {"restarts": "glucose"}),
+    # the CDCL solvers propagate exactly-one groups natively, this keeps the pairwise clauses instead
+    "solve_vsids_pairwise": ("solve_vsids", {"native_amo": False}),
+}
+
+
+# solvers compared by SATExperiment and benchmark.py, names from SOLVER_CONFIGS select a restart policy
+SOLVERS = ["solve_heuristic_2", "solve_heuristic_1", "solve_dpll", "solve_cdcl", "solve_vsids",
+           "solve_vsids_luby", "solve_vsids_glucose"]
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from SAT_solver import SATSolver
+from batch_solver import BatchSolver
+from encoder.batch_encode import BatchEncoder, SYMBOLS
+from solution_cache import SolutionCache, canonical_form, decode_givens, encode_grid
+from solver_configs import SOLVER_CONFIGS
+from sudoku_rules import generate_rules
+
+# sudoku sizes whose rules every worker generates before the first request
+WARM_SIZES = (4, 9, 16)
+# seconds a request may take when it does not set its own time_limit
+DEFAULT_TIME_LIMIT = 60.0
+
+
+def warm_up(sizes):
+    '''
+    Worker initializer: builds the rule bases once, later requests on them skip the rules entirely
+    '''
+    # ctrl-c is for the daemon, which shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for n in sizes:
+        generate_rules(n)
+
+
+def puzzle_string(grid):
+    return "".join(SYMBOLS[value - 1] for value in grid)
+
+
+def solve_request(request):
+    '''
+    Solves one request in a worker process and returns the response (without the id).
+    A request holds one of
+        "puzzle":  a sudoku in the puzzle file format ("." or "0" for an empty cell)
+        "puzzles": a list of such sudokus, solved together by the BatchSolver
+        "dimacs":  DIMACS text, with "rules": n it only holds the givens of an n x n sudoku
+    and optionally "algo" (a solver method or a name from SOLVER_CONFIGS) and "time_limit" in seconds
+    (for "puzzles" the limit of the whole batch).
+    '''
+    start_time = time.perf_counter()
+    algo = request.get("algo", "solve_vsids")
+    method, kwargs = SOLVER_CONFIGS.get(algo, (algo, {}))
+    if not method.startswith("solve") or not hasattr(SATSolver, method):
+        raise Exception(f"Error, unknown solver {algo}!")
+
+    if "puzzles" in request:
+        encoder = BatchEncoder("request", lines=[puzzle.encode() for puzzle in request["puzzles"]])
+        batch_solver = BatchSolver(encoder.n, method, time_limit=request.get("time_limit"))
+        solutions = batch_solver.solve(encoder.values, len(encoder))
+        return {"status": batch_solver.statuses,
+                "solutions": [puzzle_string(solution) if solution else None for solution in solutions],
+                "time": time.perf_counter() - start_time}
+
+    if "puzzle" in request:
+        encoder = BatchEncoder("request", lines=[request["puzzle"].encode()])
+        solver = SATSolver("request", rule_base=generate_rules(encoder.n), givens=encoder[0])
+    elif "dimacs" in request:
+        rule_base = generate_rules(request["rules"]) if request.get("rules") else None
+        solver = SATSolver("request", rule_base=rule_base, dimacs=request["dimacs"].encode())
+    else:
+        raise Exception("Error, a request needs a puzzle, puzzles or dimacs!")
+    solver.set_budget(time_limit=request.get("time_limit"))
+    getattr(solver, method)(**kwargs)
+
+    response = {"status": solver.status, "time": time.perf_counter() - start_time}
+    if solver.status == "SAT":
+        true_names = sorted(solver.var_names[var] for var, value in solver.solution.items() if value)
+        if "puzzle" in request:
+            response["solution"] = puzzle_string(decode_givens(true_names, encoder.n))
+        else:
+            # the model as the solution files have it: every variable by its DIMACS name
+            response["model"] = sorted((solver.var_names[var] if value else -solver.var_names[var]
+                                        for var, value in solver.solution.items()), key=abs)
+    return response
+
+
+class SolverDaemon():
+    """
+    Warm state shared by all connections: a pool of worker processes that generated the
+    sudoku rules at start-up, and the solution cache (see solution_cache.py), which answers
+    single puzzles equivalent to an earlier one without sending them to a worker.
+    Requests without a time_limit get the daemon's, so no request keeps a worker forever.
+    """
+    def __init__(self, workers=2, cache_file=None, sizes=WARM_SIZES, time_limit=DEFAULT_TIME_LIMIT, max_candidates=2000):
+        # spawned workers, forking a process that already runs server threads is not safe
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                        initializer=warm_up, initargs=(sizes,))
+        # start every worker now, so the first requests do not pay for the start-up
+        for future in [self.pool.submit(warm_up, ()) for _ in range(workers)]:
+            future.result()
+        self.cache = SolutionCache(cache_file)
+        self.cache_lock = threading.Lock()
+        self.time_limit = time_limit
+        # symmetry candidates a connection thread may try to canonicalize a puzzle
+        self.max_candidates = max_candidates
+
+    def canonicalize(self, givens, n):
+        '''
+        Canonical form of a single puzzle, or None when it is too symmetric to canonicalize
+        cheaply, such a puzzle bypasses the cache. Runs outside the cache lock.
+        '''
+        grid = decode_givens(givens, n)
+        return canonical_form(grid, n, self.max_candidates) if grid is not None else None
+
+    def cached(self, form, n):
+        '''
+        Response for a single puzzle from the solution cache, or None
+        '''
+        if form is None:
+            return None
+        with self.cache_lock:
+            literals = self.cache.lookup_form(form, n)
+        if literals is None:
+            return None
+        return {"status": "SAT", "solution": puzzle_string(decode_givens(literals, n)), "cached": True}
+
+    def remember(self, form, n, response):
+        if form is not None and response.get("status") == "SAT":
+            grid = [SYMBOLS.index(symbol) + 1 for symbol in response["solution"]]
+            with self.cache_lock:
+                self.cache.store_form(form, n, encode_grid(grid, n))
+
+    def handle(self, line):
+        '''
+        Answers one JSON request line, errors are answered with an "error" message
+        '''
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise Exception("Error, a request is a JSON object!")
+            if request.get("time_limit") is None:
+                request["time_limit"] = self.time_limit
+            puzzle = None
+            if "puzzle" in request:
+                encoder = BatchEncoder("request", lines=[request["puzzle"].encode()])
+                puzzle = (self.canonicalize(encoder[0], encoder.n), encoder.n)
+            response = self.cached(*puzzle) if puzzle else None
+            if response is None:
+                response = self.pool.submit(solve_request, request).result()
+                if puzzle:
+                    self.remember(*puzzle, response)
+        except Exception as e:
+            response = {"error": str(e)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.cache.close()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    One connection: any number of requests, one JSON object per line, each answered by one line
+    '''
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                response = self.server.daemon.handle(line)
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(socket_path=None, port=None, workers=2, cache_file=None, time_limit=DEFAULT_TIME_LIMIT):
+    '''
+    Runs the daemon on a unix domain socket, or on localhost TCP when a port is given
+    '''
+    daemon = SolverDaemon(workers, cache_file, time_limit=time_limit)
+    if port is not None:
+        server = TCPServer(("127.0.0.1", port), RequestHandler)
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixServer(socket_path, RequestHandler)
+    server.daemon = daemon
+    print(f"solver daemon with {workers} workers listening on {socket_path if port is None else port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
+        if port is None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def send_request(request, socket_path=None, port=None):
+    '''
+    Client side: sends one request to a running daemon and returns its response
+    '''
+    if port is not None:
+        connection = socket.create_connection(("127.0.0.1", port))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+if __name__ == "__main__":
+    # python solver_server.py serve [--socket PATH | --port N] [--workers N] [--cache FILE] [--time-limit S]
+    # python solver_server.py send (puzzle | dimacs_file) [--socket PATH | --port N] [--rules N] [--algo NAME] [--time-limit S]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("serve", "send"))
+    parser.add_argument("puzzle", nargs="?", help="a puzzle string or a DIMACS file to send")
+    parser.add_argument("--socket", default="/tmp/sat_solver.sock")
+    parser.add_argument("--port", type=int, help="localhost TCP port instead of the unix socket")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cache", metavar="FILE", help="solution cache file kept between runs")
+    parser.add_argument("--rules", type=int, metavar="N", help="the DIMACS file only holds the givens of an NxN sudoku")
+    parser.add_argument("--algo", default="solve_vsids")
+    parser.add_argument("--time-limit", type=float, metavar="S",
+                        help=f"seconds per request (serve: the default for requests without one, {DEFAULT_TIME_LIMIT})")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        time_limit = args.time_limit if args.time_limit is not None else DEFAULT_TIME_LIMIT
+        serve(args.socket, args.port, args.workers, args.cache, time_limit)
+    else:
+        if args.puzzle is None:
+            raise Exception("Error, nothing to send!")
+        request = {"id": 1, "algo": args.algo}
+        if args.time_limit is not None:
+            request["time_limit"] = args.time_limit
+        if os.path.isfile(args.puzzle):
+            with open(args.puzzle, "r") as f:
+                request["dimacs"] = f.read()
+            request["rules"] = args.rules
+        else:
+            request["puzzle"] = args.puzzle
+        start_time = time.perf_counter()
+        response = send_request(request, args.socket, args.port)
+        print(json.dumps(response))
+        print(f"Elapsed time: {time.perf_counter() - start_time} seconds")
@@ -0,0 +1,126 @@
+from itertools import combinations
+
+
+def find_exactly_one_groups(clause_lits, clause_offsets):
+    """
+    Finds the exactly-one constraints hidden in a clause database: a clause whose
+    literals are also pairwise excluded by binary clauses (-a -b) means exactly one
+    of its literals is true. In the sudoku rules these are the cell, row, column
+    and box constraints. Returns a list of tuples of literals.
+    """
+    # every binary clause (-a -b) forbids a and b from being true together
+    excluded_pairs = set()
+    long_clauses = []
+    for i in range(len(clause_offsets) - 1):
+        start, end = clause_offsets[i], clause_offsets[i + 1]
+        if end - start == 2:
+            a, b = -clause_lits[start], -clause_lits[start + 1]
+            # (-a -a) is a unit and a tautology excludes nothing
+            if a != b and a != -b:
+                excluded_pairs.add((a, b) if a < b else (b, a))
+        elif end - start > 2:
+            # repeated literals are dropped, a tautology is no exactly-one constraint
+            clause = tuple(dict.fromkeys(clause_lits[start:end]))
+            if len(clause) > 2 and not any(-literal in clause for literal in clause):
+                long_clauses.append(clause)
+
+    groups = []
+    for clause in long_clauses:
+        if all(((a, b) if a < b else (b, a)) in excluded_pairs for a, b in combinations(clause, 2)):
+            groups.append(clause)
+    return groups
+
+
+class SudokuFrontend():
+    """
+    Sudoku style constraint propagation over the exactly-one groups of a formula.
+    Every group keeps a bitmask of the literals that can still be true: a true literal
+    eliminates the rest of its groups, and a group with a single candidate left forces
+    it. On cell groups that is a naked single, on row, column and box groups a hidden single.
+
+    Unit propagation on the pairwise encoding already finds singles, so on top of that
+    groups sharing several literals (a box and a row, say) are checked for locked
+    candidates: once every candidate of one group lies in the intersection, the
+    other group's literals outside the intersection are eliminated.
+    """
+    def __init__(self, clause_lits, clause_offsets):
+        self.groups = find_exactly_one_groups(clause_lits, clause_offsets)
+        # literal -> list of (group index, bit of the literal in that group)
+        self.memberships = {}
+        for g, group in enumerate(self.groups):
+            for bit, literal in enumerate(group):
+                self.memberships.setdefault(literal, []).append((g, 1 << bit))
+
+        # (group a, its intersection bits, group b, its intersection bits) for groups sharing 2+ literals
+        self.intersections = []
+        shared = {}
+        for literal, members in self.memberships.items():
+            for (a, bit_a), (b, bit_b) in combinations(members, 2):
+                masks = shared.setdefault((a, b), [0, 0])
+                masks[0] |= bit_a
+                masks[1] |= bit_b
+        for (a, b), (mask_a, mask_b) in shared.items():
+            if mask_a & (mask_a - 1):
+                self.intersections.append((a, mask_a, b, mask_b))
+                self.intersections.append((b, mask_b, a, mask_a))
+
+    def propagate(self, units):
+        """
+        Propagates the given unit literals (e.g. the puzzle's givens) through the groups.
+        Returns every literal that is now known to be true or false, or None if the
+        givens contradict each other.
+        """
+        groups = self.groups
+        memberships = self.memberships
+        candidates = [(1 << len(group)) - 1 for group in groups]
+        value = {}
+        queue = []
+
+        def assign(literal):
+            known = value.get(abs(literal))
+            if known is not None:
+                return known == (literal > 0)
+            value[abs(literal)] = literal > 0
+            queue.append(literal)
+            return True
+
+        for literal in units:
+            if not assign(literal):
+                return None
+
+        while queue:
+            literal = queue.pop()
+
+            # a true literal only leaves itself in its groups
+            for g, bit in memberships.get(literal, ()):
+                for other_bit, other in enumerate(groups[g]):
+                    if candidates[g] & (1 << other_bit) and (1 << other_bit) != bit:
+                        if not assign(-other):
+                            return None
+                candidates[g] = bit
+
+            # a false literal is removed, a group with one candidate left forces it
+            for g, bit in memberships.get(-literal, ()):
+                mask = candidates[g] & ~bit
+                if mask == candidates[g]:
+                    continue
+                candidates[g] = mask
+                if mask == 0:
+                    return None
+                if mask & (mask - 1) == 0:
+                    if not assign(groups[g][mask.bit_length() - 1]):
+                        return None
+
+            if queue:
+                continue
+
+            # locked candidates, only once the singles have run dry
+            for a, mask_a, b, mask_b in self.intersections:
+                if candidates[a] & ~mask_a == 0 and candidates[b] & ~mask_b:
+                    outside = candidates[b] & ~mask_b
+                    for bit, other in enumerate(groups[b]):
+                        if outside & (1 << bit):
+                            if not assign(-other):
+                                return None
+
+        return [var if truth else -var for var, truth in value.items()]
@@ -0,0 +1,83 @@
+import math
+import sys
+import time
+from array import array
+from itertools import accumulate, chain, combinations
+from operator import itemgetter
+
+from SAT_solver import RuleBase
+from encoder.batch_encode import variable_base
+
+# rule bases generated in this process, keyed by n
+generated_rules = {}
+
+
+def sudoku_groups(n):
+    '''
+    The exactly-one groups of an n x n sudoku over the internal variables (r * n + c) * n + v + 1
+    (r, c and v counted from 0): one value per cell, and every value once per row, column and box
+    '''
+    box = math.isqrt(n)
+    if box * box != n:
+        raise Exception(f"Error, a {n}x{n} sudoku has no square boxes!")
+
+    def var(r, c, v):
+        return (r * n + c) * n + v + 1
+
+    cells = [[var(r, c, v) for v in range(n)] for r in range(n) for c in range(n)]
+    rows = [[var(r, c, v) for c in range(n)] for r in range(n) for v in range(n)]
+    columns = [[var(r, c, v) for r in range(n)] for c in range(n) for v in range(n)]
+    boxes = [[var(b // box * box + i // box, b % box * box + i % box, v) for i in range(n)]
+             for b in range(n) for v in range(n)]
+    return cells + rows + columns + boxes
+
+
+def generate_rules(n):
+    '''
+    Builds the sudoku rules for any square n straight into a RuleBase, without a rules file.
+    Every group becomes one clause (at least one) plus its pairwise binaries (at most one),
+    the same clauses as rules/sudoku-rules-{n}x{n}.txt. Internal variables are numbered densely,
+    their DIMACS names follow the rcv scheme of the encoders (see variable_base).
+    '''
+    if n in generated_rules:
+        return generated_rules[n]
+
+    groups = sudoku_groups(n)
+    # positions of all pairs in a group, picked out of the negated group in one go
+    pairs = list(chain.from_iterable(combinations(range(n), 2)))
+    pick_pairs = itemgetter(*pairs)
+
+    clause_lits = array('i')
+    for group in groups:
+        clause_lits.extend(group)
+        clause_lits.extend(pick_pairs([-var for var in group]))
+    clause_offsets = array('i', accumulate(([n] + [2] * (len(pairs) // 2)) * len(groups), initial=0))
+
+    base = variable_base(n)
+    var_names = [0] + [base * base * (r + 1) + base * (c + 1) + v + 1
+                       for r in range(n) for c in range(n) for v in range(n)]
+
+    generated_rules[n] = RuleBase(var_names, clause_lits, clause_offsets, file_hash=f"generated-{n}x{n}")
+    return generated_rules[n]
+
+
+def write_rules(n, rules_file):
+    '''
+    Writes the generated rules as a DIMACS file
+    '''
+    rule_base = generate_rules(n)
+    with open(rules_file, "w") as f:
+        f.write(f"p cnf {max(rule_base.var_names)} {len(rule_base.clause_offsets) - 1}\n")
+        for clause in rule_base.iter_dimacs():
+            f.write(" ".join(map(str, clause)) + " 0\n")
+
+
+if __name__ == "__main__":
+    # python sudoku_rules.py n [rules_file]
+    n = int(sys.argv[1])
+    start_time = time.perf_counter()
+    rule_base = generate_rules(n)
+    print(f"{len(rule_base.clause_offsets) - 1} clauses over {n ** 3} variables "
+          f"in {time.perf_counter() - start_time} seconds")
+    if len(sys.argv) > 2:
+        write_rules(n, sys.argv[2])
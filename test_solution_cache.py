@@ -0,0 +1,90 @@
+import pytest
+
+from SAT_solver import SATSolver
+from solution_cache import SolutionCache, decode_givens
+from sudoku_rules import generate_rules
+
+# the givens of test_sets/encoded/4x4_sudokus/sudoku_1.txt, the puzzle has exactly one solution
+GIVENS = [143, 234, 241, 311, 324, 413]
+SOLUTION = [114, 121, 132, 143, 212, 223, 234, 241, 311, 324, 333, 342, 413, 422, 431, 444]
+
+
+def generated(givens):
+    return SATSolver("test", rule_base=generate_rules(4), givens=givens)
+
+
+def from_dimacs(givens, extra=()):
+    # the generated rules written out as DIMACS, as a full puzzle file holds them
+    clauses = list(generate_rules(4).iter_dimacs()) + [(literal,) for literal in givens] + list(extra)
+    text = f"p cnf 444 {len(clauses)}\n" + "".join(" ".join(map(str, clause)) + " 0\n" for clause in clauses)
+    return SATSolver("test", dimacs=text.encode())
+
+
+def transposed(literals):
+    # cell (r, c) goes to (c, r) and every digit d to 5 - d
+    return [literal // 10 % 10 * 100 + literal // 100 * 10 + 5 - literal % 10 for literal in literals]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SolutionCache(str(tmp_path / "cache"))
+    solver = generated(GIVENS)
+    solver.solve_vsids()
+    cache.remember(solver)
+    yield cache
+    cache.close()
+
+
+def test_round_trip_through_a_symmetry(cache):
+    solver = generated(transposed(GIVENS))
+    assert cache.fetch(solver)
+    assert solver.verify_model()
+    assert sorted(solver.var_names[var] for var, value in solver.solution.items() if value) == sorted(transposed(SOLUTION))
+
+
+def test_full_dimacs_file_shares_the_entry(cache):
+    solver = from_dimacs(GIVENS)
+    assert cache.fetch(solver) and solver.verify_model()
+
+
+def test_entries_survive_reopening(tmp_path, cache):
+    cache.close()
+    reopened = SolutionCache(str(tmp_path / "cache"))
+    assert reopened.fetch(generated(GIVENS))
+    reopened.close()
+
+
+def test_negative_given_against_the_solution(cache):
+    # -114 rules out the value the only solution has in cell (1, 1)
+    solver = generated(GIVENS + [-114])
+    assert not cache.fetch(solver)
+    solver.solve_vsids()
+    assert solver.status == "UNSAT"
+    solver = from_dimacs(GIVENS + [-114])
+    assert not cache.fetch(solver)
+
+
+def test_negative_given_implied_by_the_givens(cache):
+    # cell (1, 4) holds a 3, so it is no 1, and row 1 has its 3 there, so (1, 1) is no 3
+    assert decode_givens(GIVENS + [-141, -113], 4) is not None
+    assert decode_givens(GIVENS + [-114], 4) is None
+    assert decode_givens(GIVENS + [-143], 4) is None
+    solver = generated(GIVENS + [-141, -113])
+    assert cache.fetch(solver) and solver.verify_model()
+
+
+def test_other_rules_do_not_share_entries(cache):
+    # one extra rule, and the only solution of the plain puzzle breaks it
+    solver = from_dimacs(GIVENS, extra=[(-114, -223)])
+    assert not cache.fetch(solver)
+    solver.solve_vsids()
+    assert solver.status == "UNSAT"
+
+
+def test_cached_solution_that_does_not_fit_is_not_used(cache):
+    # corrupt the stored grid: swapping two labels keeps it a sudoku but breaks the givens
+    key, grid = next(iter(cache.memory.items()))
+    cache.memory[key] = grid.translate(bytes.maketrans(b"\x01\x02", b"\x02\x01"))
+    solver = generated(GIVENS)
+    assert not cache.fetch(solver)
+    assert solver.status is None
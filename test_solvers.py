@@ -0,0 +1,92 @@
+import os
+import random
+from itertools import combinations, product
+
+import pytest
+
+from SAT_solver import SATSolver
+
+# (solve method, keyword arguments): every search, the CDCL ones with and without native AMO groups
+SOLVE_RUNS = [
+    ("solve_dpll", {}),
+    ("solve_heuristic_1", {}),
+    ("solve_heuristic_2", {}),
+    ("solve_cdcl", {}),
+    ("solve_cdcl", {"native_amo": False}),
+    ("solve_vsids", {}),
+    ("solve_vsids", {"native_amo": False}),
+    ("solve", {}),
+    ("solve", {"native_amo": False}),
+]
+PREPROCESSORS = (None, "preprocess", "sudoku_preprocess")
+
+
+def to_dimacs(num_vars, clauses):
+    return (f"p cnf {num_vars} {len(clauses)}\n" + "".join(" ".join(map(str, clause)) + " 0\n"
+                                                         for clause in clauses)).encode()
+
+
+def brute_force(num_vars, clauses):
+    return any(all(any((literal > 0) == bits[abs(literal) - 1] for literal in clause) for clause in clauses)
+               for bits in product((False, True), repeat=num_vars))
+
+
+def random_formula(rng):
+    '''
+    A few variables, some exactly-one groups (so native AMO kicks in) and random clauses
+    of 1 to 3 literals, repeated literals and tautologies included
+    '''
+    num_vars = rng.randint(1, 6)
+    clauses = []
+    for _ in range(rng.randint(0, 2)):
+        if num_vars > 1:
+            group = rng.sample(range(1, num_vars + 1), rng.randint(2, min(4, num_vars)))
+            clauses.append(group)
+            clauses += [[-a, -b] for a, b in combinations(group, 2)]
+    for _ in range(rng.randint(0, 8)):
+        clauses.append([rng.choice((1, -1)) * rng.randint(1, num_vars) for _ in range(rng.randint(1, 3))])
+    rng.shuffle(clauses)
+    return num_vars, clauses
+
+
+def run(num_vars, clauses, method, kwargs, preprocessor=None):
+    '''
+    Status of one solve, and whether a SAT model satisfies every clause (by DIMACS name)
+    '''
+    solver = SATSolver("test", dimacs=to_dimacs(num_vars, clauses))
+    if preprocessor is not None and getattr(solver, preprocessor)() is False:
+        return "UNSAT", False
+    getattr(solver, method)(**kwargs)
+    if solver.status != "SAT":
+        return solver.status, False
+    model = {solver.var_names[var]: value for var, value in solver.solution.items()}
+    return "SAT", all(any(model.get(abs(literal)) == (literal > 0) for literal in clause) for clause in clauses)
+
+
+@pytest.mark.parametrize("method, kwargs", SOLVE_RUNS)
+def test_repeated_literal_unit_inside_a_group(method, kwargs):
+    # (-1 -1) is the unit -1, not a pair the exactly-one group 1 2 3 already enforces
+    clauses = [[1, 2, 3], [-1, -2], [-1, -3], [-2, -3], [-1, -1], [-2], [-3]]
+    assert run(3, clauses, method, kwargs) == ("UNSAT", False)
+
+
+@pytest.mark.parametrize("method, kwargs", SOLVE_RUNS)
+def test_empty_formula(method, kwargs):
+    assert run(0, [], method, kwargs) == ("SAT", True)
+
+
+@pytest.mark.parametrize("preprocessor", PREPROCESSORS)
+@pytest.mark.parametrize("method, kwargs", SOLVE_RUNS)
+def test_random_formulas_against_brute_force(method, kwargs, preprocessor):
+    rng = random.Random(2024)
+    for _ in range(150):
+        num_vars, clauses = random_formula(rng)
+        status, valid = run(num_vars, clauses, method, kwargs, preprocessor)
+        assert status == ("SAT" if brute_force(num_vars, clauses) else "UNSAT"), clauses
+        assert valid or status == "UNSAT", clauses
+
+
+def test_sudoku_file():
+    solver = SATSolver(os.path.join(os.path.dirname(__file__), "test_sets/encoded/sudoku1.cnf"))
+    solver.solve_vsids()
+    assert solver.status == "SAT" and solver.verify_model()